@@ -328,6 +328,72 @@ class TestCreation(unittest.TestCase):
             for original_trace, trs_trace in zip(trs_traces, original_traces):
                 self.assertEqual(original_trace, trs_trace)
 
+    def test_read_while_writing(self):
+        trace_count = 10
+        sample_count = 100
+
+        with trsfile.open(self.tmp_path, 'w', padding_mode=TracePadding.AUTO) as trs_traces:
+            for i in range(0, trace_count):
+                trs_traces.append(Trace(SampleCoding.SHORT, [i] * sample_count, TraceParameterMap()))
+
+                # Reading back a trace should not change the size of the file
+                self.assertEqual(trs_traces[i][0], i)
+
+        with trsfile.open(self.tmp_path, 'r') as trs_traces:
+            self.assertEqual(len(trs_traces), trace_count)
+            self.assertEqual(trs_traces[-1][0], trace_count - 1)
+
+    def test_capacity(self):
+        trace_count = 10
+        sample_count = 100
+
+        with trsfile.open(self.tmp_path, 'w', padding_mode=TracePadding.AUTO, capacity=100) as trs_traces:
+            for i in range(0, trace_count):
+                trs_traces.append(Trace(SampleCoding.SHORT, [i] * sample_count, TraceParameterMap()))
+            trace_block_size = trace_count * trs_traces.engine.trace_length
+            self.assertGreater(os.path.getsize(self.tmp_path), trs_traces.engine.traceblock_offset + trace_block_size)
+
+        # The reserved space is released when closing the file
+        with trsfile.open(self.tmp_path, 'r') as trs_traces:
+            self.assertEqual(len(trs_traces), trace_count)
+            self.assertEqual(os.path.getsize(self.tmp_path), trs_traces.engine.traceblock_offset + trace_block_size)
+
+        # Without a capacity, the file size always matches the traces written so far
+        with trsfile.open(self.tmp_path, 'w', padding_mode=TracePadding.AUTO) as trs_traces:
+            for i in range(0, trace_count):
+                trs_traces.append(Trace(SampleCoding.SHORT, [i] * sample_count, TraceParameterMap()))
+                self.assertEqual(os.path.getsize(self.tmp_path),
+                                 trs_traces.engine.traceblock_offset + (i + 1) * trs_traces.engine.trace_length)
+
+        with self.assertRaises(ValueError):
+            trsfile.open(self.tmp_path, 'w', capacity=-1)
+        with self.assertRaises(ValueError):
+            trsfile.open(self.tmp_path, 'w', capacity=100, live_update=True)
+
+    def test_live_update(self):
+        trace_count = 10
+        sample_count = 100
+
+        with trsfile.open(self.tmp_path, 'w', padding_mode=TracePadding.AUTO, live_update=3) as trs_traces:
+            for i in range(0, trace_count):
+                trs_traces.append(Trace(SampleCoding.SHORT, [i] * sample_count, TraceParameterMap()))
+
+                # A reader sees all traces after a live update while the writer is still open
+                if (i + 1) % 3 == 0:
+                    with trsfile.open(self.tmp_path, 'r') as trs_reader:
+                        self.assertEqual(len(trs_reader), i + 1)
+                        self.assertEqual(trs_reader[-1][0], i)
+
+    def test_live_update_not_durable(self):
+        with trsfile.open(self.tmp_path, 'w', padding_mode=TracePadding.AUTO, live_update=True, durable=False) as trs_traces:
+            for i in range(0, 5):
+                trs_traces.append(Trace(SampleCoding.SHORT, [i] * 100, TraceParameterMap()))
+
+                # A reader sees the written traces through the page cache
+                with trsfile.open(self.tmp_path, 'r') as trs_reader:
+                    self.assertEqual(len(trs_reader), i + 1)
+                    self.assertEqual(trs_reader[-1][0], i)
+
     def test_read_non_existing(self):
         with self.assertRaises(FileNotFoundError):
             with trsfile.open(self.tmp_path, 'r'):
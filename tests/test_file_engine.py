@@ -0,0 +1,156 @@
+import pickle
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import trsfile
+from trsfile import SampleCoding, Trace
+from trsfile.engine.file import FileEngine
+from trsfile.parametermap import TraceParameterMap
+from trsfile.traceparameter import ByteArrayParameter
+
+
+class TestFileEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='trsfile_')
+        self.tmp_path = str(Path(self.tmp_dir) / 'traces')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, True)
+
+    def create_traces(self, trace_count, sample_count=100):
+        return [
+            Trace(
+                SampleCoding.FLOAT,
+                [i] * sample_count,
+                TraceParameterMap({'LEGACY_DATA': ByteArrayParameter(i.to_bytes(8, byteorder='big'))}),
+                title='trace {0:d}'.format(i)
+            )
+            for i in range(trace_count)
+        ]
+
+    def test_write_read(self):
+        traces = self.create_traces(20)
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(traces)
+            del trs_traces[5:10]
+
+        with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_traces:
+            self.assertEqual(len(trs_traces), 15)
+            expected = traces[:5] + traces[10:]
+            for expected_trace, trs_trace in zip(expected, trs_traces):
+                self.assertEqual(expected_trace.title, trs_trace.title)
+                self.assertEqual(expected_trace.parameters, trs_trace.parameters)
+                self.assertListEqual(list(expected_trace.samples), list(trs_trace.samples))
+
+    def test_append(self):
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(10))
+
+        with trsfile.open(self.tmp_path, 'a', engine='FileEngine') as trs_traces:
+            self.assertEqual(len(trs_traces), 10)
+            trs_traces.extend(self.create_traces(5))
+            self.assertEqual(len(trs_traces), 15)
+
+        with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_traces:
+            self.assertEqual(len(trs_traces), 15)
+            self.assertEqual(trs_traces[-1].title, 'trace 4')
+
+    def test_modify_while_iterating(self):
+        traces = self.create_traces(10)
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(traces)
+
+            # Changes made during an iteration are seen by the rest of that iteration
+            titles = []
+            for i, trace in enumerate(trs_traces):
+                titles.append(trace.title)
+                if i == 1:
+                    trs_traces[2] = Trace(SampleCoding.FLOAT, [0] * 100, title='replaced')
+                elif i == 3:
+                    del trs_traces[4]
+            self.assertEqual(titles, ['trace 0', 'trace 1', 'replaced', 'trace 3'] +
+                             ['trace {0:d}'.format(i) for i in range(5, 10)])
+
+    def test_lazy_samples(self):
+        traces = self.create_traces(10)
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(traces)
+
+        with trsfile.open(self.tmp_path, 'r', engine='FileEngine', lazy_samples=True) as trs_traces:
+            for expected_trace, trs_trace in zip(traces, trs_traces):
+                self.assertEqual(expected_trace.sample_coding, trs_trace.sample_coding)
+                self.assertListEqual(list(expected_trace.samples), list(trs_trace.samples))
+
+    def test_get_samples(self):
+        traces = self.create_traces(10)
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(traces)
+
+        with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_traces:
+            samples = trs_traces.get_samples()
+            self.assertEqual(samples.shape, (10, 100))
+            self.assertListEqual(list(trs_traces.get_samples(3)), list(traces[3].samples))
+
+            # An empty selection keeps the sample type and number of samples
+            empty = trs_traces.get_samples(slice(0, 0))
+            self.assertEqual(empty.shape, (0, 100))
+            self.assertEqual(empty.dtype, samples.dtype)
+
+        with trsfile.open(self.tmp_path, 'a', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(1, sample_count=50))
+            with self.assertRaises(ValueError):
+                trs_traces.get_samples()
+
+        # Traces with a different sample coding are not converted to a common type
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(2))
+            trs_traces.append(Trace(SampleCoding.SHORT, [1] * 100))
+            with self.assertRaises(ValueError):
+                trs_traces.get_samples()
+
+    def test_flush(self):
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(10))
+            trs_traces.flush()
+
+            # A reader sees the flushed state while the writer is still open
+            with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_reader:
+                self.assertEqual(len(trs_reader), 10)
+
+    def test_delete_before_flush(self):
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(10))
+            trs_traces.flush()
+            del trs_traces[0:5]
+            trs_traces[0] = self.create_traces(1)[0]
+
+            # The info file on disk still refers to the removed traces, so their files are kept until a flush
+            with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_reader:
+                self.assertEqual(len(trs_reader), 10)
+                self.assertEqual(trs_reader[5].title, 'trace 5')
+
+            trs_traces.flush()
+            with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_reader:
+                self.assertEqual([trace.title for trace in trs_reader], ['trace 0'] +
+                                 ['trace {0:d}'.format(i) for i in range(6, 10)])
+            self.assertEqual(len(list(Path(self.tmp_path).glob('*.samples'))), 5)
+
+    def test_legacy_info_file(self):
+        with trsfile.open(self.tmp_path, 'w', engine='FileEngine') as trs_traces:
+            trs_traces.extend(self.create_traces(10))
+            headers = trs_traces.get_headers()
+
+        # Older versions only stored the headers in the info file
+        with (Path(self.tmp_path) / FileEngine.INFO_FILE).open('wb') as f:
+            pickle.dump(headers, f)
+
+        with trsfile.open(self.tmp_path, 'r', engine='FileEngine') as trs_traces:
+            self.assertEqual(len(trs_traces), 10)
+            self.assertEqual(trs_traces[0].title, 'trace 0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -121,3 +121,9 @@ class TestHeader(unittest.TestCase):
         self.trs_file.append(trace)
         with self.assertRaises(IOError):
             self.trs_file.update_header(Header.DESCRIPTION, "Some text")
+
+    def test_update_headers_type_error(self):
+        # Verify that only instances of Header can be used as keys
+        with self.assertRaises(TypeError):
+            self.trs_file.update_headers({'DESCRIPTION': "Some text"})
+        self.assertNotIn('DESCRIPTION', self.trs_file.get_headers())
@@ -13,6 +13,7 @@ class TestParameter(TestCase):
         param1 = BooleanArrayParameter([True, False, True])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(BooleanArrayParameter.deserialize(BytesIO(serialized_param), 3), param1)
+        self.assertEqual(BooleanArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 3), param1)
         param2 = BooleanArrayParameter(ndarray(shape=[3], dtype=bool,
                                                buffer=array([bool(val) for val in [True, False, True]])))
         self.assertEqual(param1, param2)
@@ -31,6 +32,7 @@ class TestParameter(TestCase):
         param1 = ByteArrayParameter(int_data)
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(ByteArrayParameter.deserialize(BytesIO(serialized_param), 16), param1)
+        self.assertEqual(ByteArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 16), param1)
 
         with self.assertWarns(UserWarning):
             param2 = ByteArrayParameter(ndarray(shape=[2, 2, 4], dtype=uint8,
@@ -66,6 +68,7 @@ class TestParameter(TestCase):
         param1 = DoubleArrayParameter([-0.5, 0.5, 1e6])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(DoubleArrayParameter.deserialize(BytesIO(serialized_param), 3), param1)
+        self.assertEqual(DoubleArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 3), param1)
 
         param2 = DoubleArrayParameter(ndarray(shape=[3], dtype=double, buffer=array([-0.5, 0.5, 1e6])))
         self.assertEqual(param1, param2)
@@ -107,6 +110,7 @@ class TestParameter(TestCase):
         param1 = FloatArrayParameter([-0.5, 0.5, 1e6])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(FloatArrayParameter.deserialize(BytesIO(serialized_param), 3), param1)
+        self.assertEqual(FloatArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 3), param1)
 
         param2 = FloatArrayParameter(ndarray(shape=[3], dtype=single,
                                              buffer=array([single(val) for val in [-0.5, 0.5, 1e6]])))
@@ -145,6 +149,7 @@ class TestParameter(TestCase):
         param1 = IntegerArrayParameter([-1, 1, 0x7fffffff, -0x80000000])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(IntegerArrayParameter.deserialize(BytesIO(serialized_param), 4), param1)
+        self.assertEqual(IntegerArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 4), param1)
 
         with self.assertWarns(UserWarning):
             param2 = IntegerArrayParameter(ndarray(shape=[2, 2], dtype=int32,
@@ -183,6 +188,7 @@ class TestParameter(TestCase):
         param1= LongArrayParameter([-1, 1, 0x7fffffffffffffff, -0x8000000000000000])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(LongArrayParameter.deserialize(BytesIO(serialized_param), 4), param1)
+        self.assertEqual(LongArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 4), param1)
 
         with self.assertWarns(UserWarning):
             param2 = LongArrayParameter(ndarray(shape=[2, 2], dtype=int64,
@@ -214,6 +220,7 @@ class TestParameter(TestCase):
         param1 = ShortArrayParameter([0, 1, -1, 255, 256, -32768, 32767])
         self.assertEqual(serialized_param, param1.serialize())
         self.assertEqual(ShortArrayParameter.deserialize(BytesIO(serialized_param), 7), param1)
+        self.assertEqual(ShortArrayParameter.deserialize_from_buffer(memoryview(serialized_param), 7), param1)
 
         param2 = ShortArrayParameter(ndarray(shape=[7], dtype=int16,
                                              buffer=array([int16(val) for val in [0, 1, -1, 255, 256, -32768, 32767]])))
@@ -240,11 +247,13 @@ class TestParameter(TestCase):
         param = StringParameter('The quick brown fox jumped over the lazy dog.')
         self.assertEqual(serialized_param, param.serialize())
         self.assertEqual(StringParameter.deserialize(BytesIO(serialized_param), 45), param)
+        self.assertEqual(StringParameter.deserialize_from_buffer(memoryview(serialized_param), 45), param)
 
         serialized_param = b'\xe4\xbd\xa0\xe5\xa5\xbd\xef\xbc\x8c\xe4\xb8\x96\xe7\x95\x8c'
         param = StringParameter('你好，世界')
         self.assertEqual(serialized_param, param.serialize())
         self.assertEqual(StringParameter.deserialize(BytesIO(serialized_param), 15), param)
+        self.assertEqual(StringParameter.deserialize_from_buffer(memoryview(serialized_param), 15), param)
 
         with self.assertRaises(TypeError):
             StringParameter(['The', 'quick', 'brown', 'fox', 'jumped', 'over', 'the', 'lazy', 'dog'])
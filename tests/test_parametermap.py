@@ -1,3 +1,4 @@
+import pickle
 from unittest import TestCase
 
 from trsfile.parametermap import (
@@ -22,7 +23,19 @@ from trsfile.traceparameter import (
     StringParameter,
     TraceParameterDefinition,
 )
-from io import BytesIO
+from io import BufferedReader, BytesIO, RawIOBase
+
+
+class UnseekableStream(RawIOBase):
+    """A stream that can only be read forward, such as a pipe"""
+    def __init__(self, data: bytes):
+        self.data = BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
 
 
 class TestTraceSetParameterMap(TestCase):
@@ -58,6 +71,21 @@ class TestTraceSetParameterMap(TestCase):
         param_map = TraceSetParameterMap.deserialize(BytesIO(self.SERIALIZED_MAP))
         deserialized = self.create_tracesetparametermap()
         self.assertDictEqual(param_map, deserialized)
+        self.assertDictEqual(TraceSetParameterMap.deserialize(self.SERIALIZED_MAP), deserialized)
+
+        # A stream is left right after the map
+        stream = BytesIO(b'leading' + self.SERIALIZED_MAP + b'trailing')
+        stream.seek(len(b'leading'))
+        self.assertDictEqual(TraceSetParameterMap.deserialize(stream), deserialized)
+        self.assertEqual(stream.tell(), len(b'leading') + len(self.SERIALIZED_MAP))
+        self.assertEqual(stream.read(), b'trailing')
+        # The stream can still be written to after deserializing
+        stream.write(b'more')
+
+        # Other streams only have the map read from them, even when they cannot seek
+        stream = BufferedReader(UnseekableStream(self.SERIALIZED_MAP + b'trailing'))
+        self.assertDictEqual(TraceSetParameterMap.deserialize(stream), deserialized)
+        self.assertEqual(stream.read(), b'trailing')
 
     def test_serialize(self):
         param_map = self.create_tracesetparametermap()
@@ -83,6 +111,14 @@ class TestTraceSetParameterMap(TestCase):
         param_map.add_parameter('param9', 1)
         self.assertEqual(param_map['param9'], ShortArrayParameter([1]))
 
+        # Mixed numbers get the widest type, but booleans don't mix with numbers:
+        param_map.add_parameter('param10', [1, 0x80000000, -1])
+        self.assertEqual(param_map['param10'], LongArrayParameter([1, 0x80000000, -1]))
+        param_map.add_parameter('param10', [1, 0.5])
+        self.assertEqual(param_map['param10'], DoubleArrayParameter([1, 0.5]))
+        with self.assertRaises(TypeError):
+            param_map.add_parameter('param10', [True, 1])
+
         with self.assertRaises(TypeError):
             param_map.add_parameter('param10', [False, 0, 'None'])
         with self.assertRaises(TypeError):
@@ -146,17 +182,51 @@ class TestTraceParameterDefinitionMap(TestCase):
         return param_map
 
     def test_get_total_size(self):
-        size = self.create_parameterdefinitionmap().get_total_size()
-        self.assertEqual(size, 44)
+        param_defs = self.create_parameterdefinitionmap()
+        self.assertEqual(param_defs.get_total_size(), 44)
+
+        # The size follows changes to the map
+        param_defs.append('HAS_KEY', ParameterType.BOOL, 1)
+        self.assertEqual(param_defs.get_total_size(), 45)
+        del param_defs['IN']
+        self.assertEqual(param_defs.get_total_size(), 29)
+
+        # A definition changed in place is picked up once it is assigned to the map again
+        param_defs['HAS_KEY'].length = 3
+        param_defs['HAS_KEY'] = param_defs['HAS_KEY']
+        self.assertEqual(param_defs.get_total_size(), 31)
+        self.assertEqual(param_defs._get_layout()[-1], ('HAS_KEY', BooleanArrayParameter, 44, 47, 3))
+        param_defs.clear()
+        self.assertEqual(param_defs.get_total_size(), 0)
 
     def test_deserialize(self):
         self.assertDictEqual(TraceParameterDefinitionMap.deserialize(BytesIO(self.SERIALIZED_DEFINITION)),
                              self.create_parameterdefinitionmap())
+        self.assertDictEqual(TraceParameterDefinitionMap.deserialize(self.SERIALIZED_DEFINITION),
+                             self.create_parameterdefinitionmap())
+
+        # A stream is left right after the map
+        stream = BytesIO(self.SERIALIZED_DEFINITION + b'trailing')
+        self.assertDictEqual(TraceParameterDefinitionMap.deserialize(stream), self.create_parameterdefinitionmap())
+        self.assertEqual(stream.tell(), len(self.SERIALIZED_DEFINITION))
+        stream = BufferedReader(UnseekableStream(self.SERIALIZED_DEFINITION + b'trailing'))
+        self.assertDictEqual(TraceParameterDefinitionMap.deserialize(stream), self.create_parameterdefinitionmap())
+        self.assertEqual(stream.read(), b'trailing')
 
     def test_serialize(self):
         self.assertEqual(self.create_parameterdefinitionmap().serialize(),
                          self.SERIALIZED_DEFINITION)
 
+    def test_pickle(self):
+        definition = TraceParameterDefinition(ParameterType.BYTE, 16, 4)
+        self.assertEqual(pickle.loads(pickle.dumps(definition)), definition)
+
+        # A definition pickled before TraceParameterDefinition had __slots__
+        legacy = b'\x80\x04\x95|\x00\x00\x00\x00\x00\x00\x00\x8c\x16trsfile.traceparameter\x94\x8c\x18' \
+                 b'TraceParameterDefinition\x94\x93\x94)\x81\x94}\x94(\x8c\nparam_type\x94h\x00\x8c\r' \
+                 b'ParameterType\x94\x93\x94K\x01\x85\x94R\x94\x8c\x06length\x94K\x10\x8c\x06offset\x94K\x04ub.'
+        self.assertEqual(pickle.loads(legacy), definition)
+
     def test_from_trace_params(self):
         param_map = TestTraceParameterDefinitionMap.create_traceparametermap()
         map_from_trace_params = TraceParameterDefinitionMap.from_trace_parameter_map(param_map)
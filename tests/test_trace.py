@@ -1,6 +1,7 @@
 import unittest
 import trsfile
 import binascii
+import pickle
 from os.path import dirname, abspath
 
 from trsfile.parametermap import TraceParameterMap
@@ -33,6 +34,34 @@ class TestTrsFile(unittest.TestCase):
 		self.assertEqual(self.trs_file[0], self.trs_file[0])
 		self.assertNotEqual(self.trs_file[0], self.trs_file[1])
 
+	def test_lazy_samples(self):
+		"""Check if samples given as a callable are only loaded on first access"""
+		calls = []
+
+		def load_samples():
+			calls.append(None)
+			return [1, 2, 3]
+
+		trace = trsfile.Trace(trsfile.SampleCoding.SHORT, load_samples)
+		self.assertEqual(len(calls), 0)
+		self.assertEqual(trace.samples.dtype, 'int16')
+		self.assertEqual(len(trace), 3)
+		self.assertEqual(len(calls), 1)
+
+	def test_legacy_pickle(self):
+		"""Check if a trace pickled before samples could be loaded on first access can still be unpickled"""
+		trace = self.trs_file[0]
+
+		class LegacyTrace:
+			def __reduce__(self):
+				# The state of a Trace pickled by previous versions, with the samples as a plain attribute
+				state = {'title': trace.title, 'parameters': trace.parameters, 'sample_coding': trace.sample_coding,
+						 'samples': trace.samples, 'headers': trace.headers}
+				return object.__new__, (trsfile.Trace,), state
+
+		self.assertEqual(pickle.loads(pickle.dumps(LegacyTrace())), trace)
+		self.assertEqual(pickle.loads(pickle.dumps(trace)), trace)
+
 
 if __name__ == '__main__':
 	unittest.main()
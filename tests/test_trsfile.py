@@ -30,6 +30,13 @@ class TestTrsFile(unittest.TestCase):
 			i += 1
 		self.assertEqual(i, len(self.trs_file))
 
+	def test_iterator_batches(self):
+		"""Check if iterating in batches yields every trace once and in order"""
+		self.trs_file.ITERATOR_BATCH_SIZE = 7
+		for i, trace in enumerate(self.trs_file):
+			self.assertEqual(trace, self.trs_file[i])
+		self.assertEqual(i, len(self.trs_file) - 1)
+
 	def test_read_only(self):
 		"""Check if the TrsFile is read only"""
 		with self.assertRaises(TypeError):
@@ -44,6 +51,27 @@ class TestTrsFile(unittest.TestCase):
 		traces = self.trs_file[::steps]
 		self.assertEqual(len(traces), len(self.trs_file) // steps)
 
+	def test_shared_headers(self):
+		"""Check if all traces refer to the headers of the trace set instead of a copy"""
+		traces = self.trs_file[0:10]
+		for trace in traces:
+			self.assertIs(trace.headers, self.trs_file.get_headers())
+
+	def test_sample_region(self):
+		"""Check if the samples of the last trace are read from the sample region only"""
+		engine = self.trs_file.engine
+		offset = engine.traceblock_offset + len(self.trs_file) * engine.trace_length - engine.sample_length
+		expected = numpy.fromfile(engine.path, self.trs_file[-1].sample_coding.format, offset=offset)
+		self.assertTrue(numpy.array_equal(self.trs_file[-1].samples, expected))
+
+	def test_get_samples(self):
+		"""Check if the samples of many traces can be retrieved as a single array"""
+		samples = self.trs_file.get_samples()
+		self.assertEqual(samples.shape, (90, 500))
+		self.assertTrue(numpy.array_equal(samples[7], self.trs_file[7].samples))
+		self.assertTrue(numpy.array_equal(self.trs_file.get_samples(-1), self.trs_file[-1].samples))
+		self.assertTrue(numpy.array_equal(self.trs_file.get_samples(slice(3, 30, 4)), samples[3:30:4]))
+
 	def test_reverse(self):
 		"""Check if reverse works"""
 		for i, trace in zip(range(1, len(self.trs_file) + 1), self.trs_file.reverse()):
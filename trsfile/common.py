@@ -133,7 +133,7 @@ class Header(Enum):
 
     @classmethod
     def has_value(cls, tag):
-        return any(tag == item.value for item in cls)
+        return tag in cls._value2member_map_
 
     @classmethod
     def get_mandatory(cls):
@@ -1,5 +1,18 @@
+import numpy
+
 from trsfile.common import Header
 
+
+_MISSING = object()
+
+
+def _equal(a, b):
+	"""Compares two header values, where comparing numpy arrays results in a single boolean"""
+	if isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray):
+		return numpy.array_equal(a, b)
+	return a == b
+
+
 class Engine:
 	read_only = False
 
@@ -49,6 +62,14 @@ class Engine:
 		return self.read_only
 
 	# Functions that are optionally implemented
+	def flush(self):
+		"""Writes any pending changes of the trace set to the backing storage.
+		Engines that write all changes immediately do not need to implement this.
+
+		:returns: None
+		"""
+		pass
+
 	def del_traces(self, index):
 		"""Deletes zero or more traces from the trace set
 
@@ -79,6 +100,17 @@ class Engine:
 		"""
 		raise TypeError('Cannot get traces with this storage engine')
 
+	def get_samples(self, index):
+		"""Retrieves the samples of zero or more traces from the trace set as a
+		single array, without creating a Trace for every trace
+
+		:param index: the slice or index that specifies which samples to get
+		:type index: slice, int
+		:returns: an array with the samples of one trace per row
+		:rtype: numpy.ndarray
+		"""
+		raise TypeError('Cannot get samples with this storage engine')
+
 	# The headers as defined by the TRS specifications
 	def update_headers(self, headers):
 		"""Updates zero or more headers
@@ -95,17 +127,19 @@ class Engine:
 		if self.is_read_only():
 			raise TypeError('Cannot modify trace set, it is (opened) read-only')
 
-		if not isinstance(headers, dict) or any([not isinstance(header, Header) for header in self.headers]):
+		if not isinstance(headers, dict):
 			raise TypeError('All headers have to be of type \'Header\'')
 
 		# TODO: We can test the header type here, do we want to?
 
-		# Only update headers that are changed
+		# Validate the headers and only update headers that are changed, in one pass
 		changed_headers = {}
 		for header, value in headers.items():
-			if header in self.headers and value == self.headers[header]:
-				continue
-			changed_headers[header] = value
+			if not isinstance(header, Header):
+				raise TypeError('All headers have to be of type \'Header\'')
+			current = self.headers.get(header, _MISSING)
+			if current is _MISSING or not _equal(value, current):
+				changed_headers[header] = value
 
 		# Do nothing if nothing has changed
 		if len(changed_headers) <= 0:
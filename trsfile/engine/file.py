@@ -1,7 +1,11 @@
+import functools
+import os
 import shutil
 import time
 import numpy
 import pickle
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from trsfile.common import Header, SampleCoding
@@ -23,6 +27,12 @@ class FileEngine(Engine):
 	After acquisition, the file can be converted to the proper format with the
 	correct padding mode.
 
+	The trace set is a directory in which every trace is stored in its own
+	files: ``<n>.samples`` (the sample coding byte followed by the samples),
+	and optionally ``<n>.title`` and ``<n>.data``. The ``traceset.pickle``
+	file holds the headers and the ordered list of trace numbers, so traces
+	can be replaced or removed without touching the other traces.
+
 	This engine supports the following options:
 
 	+--------------+-----------------------------------------------------------+
@@ -31,22 +41,35 @@ class FileEngine(Engine):
 	| headers      | Dictionary containing zero or more headers, see           |
 	|              | :py:class:`trsfile.common.Header`                         |
 	+--------------+-----------------------------------------------------------+
+	| lazy_samples | Only read the samples of a trace when they are accessed.  |
+	|              | The trace set must not be modified in the meantime.       |
+	|              | Defaults to False.                                        |
+	+--------------+-----------------------------------------------------------+
 	"""
 
 	INFO_FILE = 'traceset.pickle'
+	READ_WORKERS = 8
 
 	def __get_trace_path(self, i, name):
-		return (self.path / '{0:d}.{1:s}'.format(i, name))
+		return f'{self.path_prefix}{i:d}.{name}'
 
 	def __init__(self, path, mode = 'x', **options):
 		# Defaults
 		self.path = Path(path)
+		self.path_prefix = str(self.path) + os.sep
 		self.headers = {}
 		self.read_only = False
+		self.lazy_samples = bool(options.get('lazy_samples', False))
 
 		# Shadow list of traces in files
 		self.shadow_trace_index = -1
-		self.shadow_traces = []
+		self.shadow_traces = array('q')
+
+		# Whether the headers or shadow_traces list still need to be written to disk
+		self.info_dirty = False
+
+		# Traces whose files are removed once the shadow_traces list without them is on disk
+		self.removed_traces = array('q')
 
 		# Parse the mode
 		if mode == 'r':
@@ -54,13 +77,8 @@ class FileEngine(Engine):
 			if not self.path.is_dir() or not (self.path / self.INFO_FILE).is_file():
 				raise FileNotFoundError('Path \'{0:s}\' does not point to a tmp trace set'.format(path))
 
-			# Load the headers
-			with (self.path / self.INFO_FILE).open('rb') as f:
-				self.headers = pickle.load(f)
-
-			# Initialize the shadow_traces list
-			self.shadow_traces = sorted([int(trace_path.stem) for trace_path in self.path.glob('*.samples')])
-			self.shadow_trace_index = max(self.shadow_traces) + 1
+			# Load the headers and the shadow_traces list
+			self.__load_info()
 
 			self.read_only = True
 
@@ -68,18 +86,21 @@ class FileEngine(Engine):
 			"""open for writing, truncating the file first"""
 
 			# Remove the directory if it exists
-			if self.path.is_dir():
-				shutil.rmtree(str(self.path), True)
-
-				# Wait until it is removed
+			try:
+				shutil.rmtree(str(self.path))
+			except FileNotFoundError:
+				pass
+
+			# Create the temporary folder and initialize this class. On Windows
+			# the removal may still be pending, so back off a couple of times.
+			for delay in (0.001, 0.002, 0.005, 0.01, 0.05):
 				try:
-					while self.path.is_dir():
-						time.sleep(0.001)
-				except Exception:
-					pass
-
-			# Create the temporary folder and initialize this class
-			self.path.mkdir()
+					self.path.mkdir()
+					break
+				except FileExistsError:
+					time.sleep(delay)
+			else:
+				self.path.mkdir()
 			self.__initialize_headers()
 
 		elif mode == 'x':
@@ -94,13 +115,8 @@ class FileEngine(Engine):
 		elif mode == 'a':
 			"""a = open for writing, appending to the end of the file if it exists"""
 			if self.path.is_dir() and (self.path / self.INFO_FILE).is_file():
-				# Load the headers
-				with (self.path / self.INFO_FILE).open('rb') as f:
-					self.headers = pickle.load(f)
-
-				# Initialize the shadow_traces list
-				self.shadow_traces = sorted([int(trace_path.stem) for trace_path in self.path.glob('*.samples')])
-				self.shadow_trace_index = max(self.shadow_traces) + 1
+				# Load the headers and the shadow_traces list
+				self.__load_info()
 			else:
 				# Create the temporary folder and initialize this class
 				self.path.mkdir()
@@ -127,15 +143,50 @@ class FileEngine(Engine):
 			if header not in headers:
 				headers[header] = header.default
 
-		# Store these default headers
+		# Store these default headers, the info file also marks the trace set as existing
 		self.update_headers(headers)
+		self.flush()
+
+	def __load_info(self):
+		"""Loads the headers and the shadow_traces list from the info file.
+
+		The info file holds two consecutive pickles: the headers and the shadow
+		trace list. Trace sets written by older versions only contain the
+		headers, in which case the list is recovered from the directory.
+		"""
+		with (self.path / self.INFO_FILE).open('rb') as f:
+			self.headers = pickle.load(f)
+			try:
+				shadow_traces, self.shadow_trace_index = pickle.load(f)
+				self.shadow_traces = array('q', shadow_traces)
+				return
+			except EOFError:
+				pass
+
+		# Legacy trace set, scan the directory and store the result on close
+		with os.scandir(self.path) as entries:
+			shadow_traces = [int(entry.name[:-8]) for entry in entries if entry.name.endswith('.samples')]
+		self.shadow_traces = array('q', sorted(shadow_traces))
+		self.shadow_trace_index = max(self.shadow_traces, default=-1) + 1
+		self.info_dirty = True
+
+	def flush(self):
+		"""Dumps the headers and the shadow_traces list to the info file, and
+		then removes the files of the traces that are no longer in that list"""
+		with (self.path / self.INFO_FILE).open('wb') as f:
+			pickle.dump(self.headers, f)
+			pickle.dump((self.shadow_traces, self.shadow_trace_index), f)
+		self.info_dirty = False
+
+		# The info file no longer refers to these traces, so a crash from here on leaves no missing files
+		self.__remove_trace_files(self.removed_traces)
+		self.removed_traces = array('q')
 
 	def update_headers(self, headers):
 		changed_headers = super().update_headers(headers)
 		if len(changed_headers) > 0:
-			# Dump all headers to disk
-			with (self.path / self.INFO_FILE).open('wb') as f:
-				pickle.dump(self.headers, f)
+			# Headers are dumped to disk on flush or close
+			self.info_dirty = True
 
 	def is_closed(self):
 		return not self.path.is_dir() or not (self.path / self.INFO_FILE).is_file()
@@ -158,15 +209,20 @@ class FileEngine(Engine):
 		# Do we have an exception, re-raise
 		if exception is not None:
 			raise IndexError(exception)
+		self.info_dirty = True
+
+		# Delete all traces on the file system on the next flush
+		self.removed_traces.extend(indices)
 
-		# Delete all traces on the file system
+	def __remove_trace_files(self, indices):
 		for trace_index in indices:
-			for category in ['title', 'data', 'samples']:
-				path = self.__get_trace_path(trace_index, category)
-				if path.is_file():
-					path.unlink()
+			for category in ('title', 'data', 'samples'):
+				try:
+					os.unlink(self.__get_trace_path(trace_index, category))
+				except FileNotFoundError:
+					pass
 
-	def get_traces(self, index):
+	def __get_indices(self, index):
 		# Try access, and re-raise if wrong for fancy indexing errors
 		try:
 			indices = self.shadow_traces[index]
@@ -174,36 +230,21 @@ class FileEngine(Engine):
 				indices = [indices]
 		except IndexError as exception:
 			raise IndexError(exception)
+		return indices
 
-		# Now obtain all requested traces from file
-		traces = []
-		for i in indices:
-			# Read the samples
-			path = self.__get_trace_path(i, 'samples')
-			if path.is_file():
-				with path.open('rb') as tmp_file:
-					# First byte is always sample coding
-					sample_coding = SampleCoding(tmp_file.read(1)[0])
-					samples = numpy.fromfile(tmp_file, sample_coding.format, -1)
-			else:
-				raise IOError('Unable to read samples from trace {0:d}'.format(i))
-
-			# Title
-			path = self.__get_trace_path(i, 'title')
-			if path.is_file():
-				with path.open('rb') as tmp_file:
-					title = tmp_file.read().decode('utf-8')
-			else:
-				title = Header.TRACE_TITLE.default
+	def __read_files(self, read, indices):
+		# Read multiple traces in parallel
+		if len(indices) > 1:
+			with ThreadPoolExecutor(max_workers=self.READ_WORKERS) as executor:
+				return list(executor.map(read, indices))
+		return [read(i) for i in indices]
 
-			# Read the data
-			path = self.__get_trace_path(i, 'data')
-			if path.is_file():
-				with path.open('rb') as tmp_file:
-					data = tmp_file.read()
-			else:
-				data = b''
+	def get_traces(self, index):
+		# Now obtain all requested traces from file
+		trace_files = self.__read_files(self.__read_trace_files, self.__get_indices(index))
 
+		traces = []
+		for sample_coding, samples, title, data in trace_files:
 			parameters = TraceParameterMap()
 			if data:
 				parameters['LEGACY_DATA'] = ByteArrayParameter(data)
@@ -212,6 +253,64 @@ class FileEngine(Engine):
 
 		return traces
 
+	def get_samples(self, index):
+		indices = self.__get_indices(index)
+		if len(indices) <= 0:
+			return self.__get_empty_samples()
+
+		# Only the samples files are read, all traces need the same sample coding and number of samples to form a
+		# single array
+		sample_files = self.__read_files(self.__read_samples_file, indices)
+		if len(set(sample_coding for sample_coding, _ in sample_files)) > 1:
+			raise ValueError('Traces have a different sample coding, read them as traces instead')
+		if len(set(len(samples) for _, samples in sample_files)) > 1:
+			raise ValueError('Traces have a different number of samples, read them as traces instead')
+		return numpy.stack([samples for _, samples in sample_files])
+
+	def __get_empty_samples(self):
+		# The type and number of samples follow the first trace of the set, or the headers when there are no traces
+		if len(self.shadow_traces) > 0:
+			sample_coding, _ = self.__read_samples_file(self.shadow_traces[0], lazy=True)
+			path = self.__get_trace_path(self.shadow_traces[0], 'samples')
+			return numpy.empty((0, (os.path.getsize(path) - 1) // sample_coding.size), sample_coding.format)
+		sample_coding = self.headers.get(Header.SAMPLE_CODING) or Header.SAMPLE_CODING.default
+		return numpy.empty((0, self.headers.get(Header.NUMBER_SAMPLES) or 0), sample_coding.format)
+
+	def __read_samples_file(self, i, lazy=False):
+		path = self.__get_trace_path(i, 'samples')
+		try:
+			with open(path, 'rb') as tmp_file:
+				# First byte is always sample coding, the rest of the file are samples
+				sample_coding = SampleCoding(tmp_file.read(1)[0])
+				if lazy:
+					samples = functools.partial(numpy.fromfile, path, sample_coding.format, offset=1)
+				else:
+					count = (os.fstat(tmp_file.fileno()).st_size - 1) // sample_coding.size
+					samples = numpy.fromfile(tmp_file, sample_coding.format, count)
+		except FileNotFoundError:
+			raise IOError('Unable to read samples from trace {0:d}'.format(i))
+		return sample_coding, samples
+
+	def __read_trace_files(self, i):
+		# Read the samples
+		sample_coding, samples = self.__read_samples_file(i, self.lazy_samples)
+
+		# Title
+		try:
+			with open(self.__get_trace_path(i, 'title'), 'rb') as tmp_file:
+				title = tmp_file.read().decode('utf-8')
+		except FileNotFoundError:
+			title = Header.TRACE_TITLE.default
+
+		# Read the data
+		try:
+			with open(self.__get_trace_path(i, 'data'), 'rb') as tmp_file:
+				data = tmp_file.read()
+		except FileNotFoundError:
+			data = b''
+
+		return sample_coding, samples, title, data
+
 	def set_traces(self, index, traces):
 		# Make sure we have iterable traces
 		if isinstance(traces, Trace):
@@ -225,33 +324,36 @@ class FileEngine(Engine):
 		except IndexError as exception:
 			raise IndexError(exception)
 
-		# Remove the traces from disk only to keep storage lean and mean
-		for trace_index in indices:
-			for category in ['title', 'data', 'samples']:
-				path = self.__get_trace_path(trace_index, category)
-				if path.is_file():
-					path.unlink()
-
 		# Store all traces with the next sequence numbers and keep these numbers as a list
-		new_traces = []
+		new_traces = array('q')
 		for trace in traces:
 			self.shadow_trace_index += 1
 			new_traces.append(self.shadow_trace_index)
 
+			# Encode everything before touching the file system
+			data = trace.parameters.serialize() if trace.parameters is not None and len(trace.parameters) > 0 else b''
+			raw_samples = bytes([trace.sample_coding.value]) + trace.samples.tobytes()
+
 			# Save the trace data
-			# Write the title as ascii
-			with self.__get_trace_path(self.shadow_trace_index, 'title').open('wb') as tmp_file:
-				tmp_file.write(trace.title if not isinstance(trace.title, str) else trace.title.encode('utf-8'))
+			# Write the title as ascii, a missing title file is read as the default title
+			if trace.title != Header.TRACE_TITLE.default:
+				with open(self.__get_trace_path(self.shadow_trace_index, 'title'), 'wb') as tmp_file:
+					tmp_file.write(trace.title if not isinstance(trace.title, str) else trace.title.encode('utf-8'))
 
 			# Write the data file
-			if trace.parameters is not None and len(trace.parameters) > 0:
+			if data:
 				with open(self.__get_trace_path(self.shadow_trace_index, 'data'), 'wb') as tmp_file:
-					tmp_file.write(trace.parameters.serialize())
+					tmp_file.write(data)
 
-			# Write the sample file
+			# Write the sample file, prefixed with the sample coding, in a single write
 			with open(self.__get_trace_path(self.shadow_trace_index, 'samples'), 'wb') as tmp_file:
-				tmp_file.write(bytes([trace.sample_coding.value]))
-				trace.samples.tofile(tmp_file)
+				# Reserve the space up-front to reduce fragmentation, where supported
+				if hasattr(os, 'posix_fallocate'):
+					try:
+						os.posix_fallocate(tmp_file.fileno(), 0, len(raw_samples))
+					except OSError:
+						pass
+				tmp_file.write(raw_samples)
 
 		# Now we just assign the new_traces however, the slicing works
 		if isinstance(index, slice):
@@ -260,7 +362,12 @@ class FileEngine(Engine):
 			if len(new_traces) != 1:
 				raise TypeError('assigning multiple new traces to single trace')
 			self.shadow_traces[index] = new_traces[0]
+		self.info_dirty = True
+
+		# Remove the replaced traces from disk on the next flush only to keep storage lean and mean
+		self.removed_traces.extend(indices)
 
 	def close(self):
-		# We do not need to close anything :)
-		pass
+		# Write any pending changes of the headers and shadow_traces list
+		if self.info_dirty and not self.read_only and not self.is_closed():
+			self.flush()
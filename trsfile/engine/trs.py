@@ -3,7 +3,6 @@ import mmap
 import os
 import struct
 import sys
-from io import BytesIO
 from typing import Any, Dict, List, Optional, Union
 
 import numpy
@@ -20,6 +19,51 @@ from trsfile.traceparameter import ByteArrayParameter
 
 ASCII_LESS_THAN = 0x3C
 
+_FLOAT = struct.Struct('<f')
+_BOOL = struct.Struct('<?')
+
+# Only the file data needs to be on disk, fall back to fsync where fdatasync is not available
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _encode_int(header, value):
+    # Note the delicacy with the signedness here.
+    return b'\xff' * header.length if value is None else value.to_bytes(header.length, byteorder='little', signed=header.length >= 4)
+
+
+def _encode_parameter_map(header, value):
+    tag_value = value.serialize()
+    value.lock_content()
+    return tag_value
+
+
+# Encoders of the header values, by the type of the header
+_HEADER_ENCODERS = {
+    int: _encode_int,
+    float: lambda header, value: _FLOAT.pack(0.0 if value is None else value),
+    bool: lambda header, value: _BOOL.pack(0 if value is None else value),
+    str: lambda header, value: value.encode('utf-8'),
+    SampleCoding: lambda header, value: b'\xff' if value is None else bytes([value.value]),
+    bytes: lambda header, value: value,
+    TraceSetParameterMap: _encode_parameter_map,
+    TraceParameterDefinitionMap: _encode_parameter_map,
+}
+
+# Lookups of headers that do not change
+_HEADERS_BY_TAG = {header.value: header for header in Header}
+_MANDATORY_HEADERS = frozenset(Header.get_mandatory())
+
+# Decoders of the header values, by the type of the header. Values of other types are kept as bytes.
+_HEADER_DECODERS = {
+    int: lambda value: int.from_bytes(value, byteorder='little', signed=len(value) >= 4),
+    float: lambda value: _FLOAT.unpack(value)[0],
+    bool: lambda value: _BOOL.unpack(value)[0],
+    str: lambda value: value.decode('utf-8'),
+    SampleCoding: lambda value: SampleCoding(value[0]),
+    TraceSetParameterMap: TraceSetParameterMap.deserialize,
+    TraceParameterDefinitionMap: TraceParameterDefinitionMap.deserialize,
+}
+
 
 class _FileHandleCompat:
     """File-backed mmap compatibility layer for macOS."""
@@ -54,12 +98,25 @@ class _FileHandleCompat:
     def write(self, data):
         return self._handle.write(data)
 
-    def flush(self):
+    def flush(self, offset=0, size=0):
         return self._handle.flush()
 
     def close(self):
         return self._handle.close()
 
+    def __getitem__(self, key):
+        pos = self._handle.tell()
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("slice step not supported")
+            self._handle.seek(key.start)
+            value = self._handle.read(key.stop - key.start)
+        else:
+            self._handle.seek(key)
+            value = self._handle.read(1)[0]
+        self._handle.seek(pos)
+        return value
+
     def __setitem__(self, key, value):
         if not isinstance(key, slice):
             raise TypeError("slice assignment required")
@@ -87,23 +144,44 @@ class TrsEngine(Engine):
     | live_update  | Performs live update of the TRS file every N traces. True |
     |              | for updating after every trace and False for never.       |
     +--------------+-----------------------------------------------------------+
+    | durable      | Whether a live update also synchronizes the changes to    |
+    |              | disk. Without it the changes are only visible to other    |
+    |              | readers through the page cache. Defaults to True.         |
+    +--------------+-----------------------------------------------------------+
     | padding_mode | See :py:class:`trsfile.common.TracePadding`.              |
     |              | Defaults to `TracePadding.AUTO`.                          |
     +--------------+-----------------------------------------------------------+
+    | capacity     | Number of traces to reserve space for when writing the    |
+    |              | first trace. Beyond that, the file grows by doubling. The |
+    |              | file is truncated to its actual size on close, so until   |
+    |              | then it is larger than its traces. Defaults to 0, which   |
+    |              | keeps the file size exact. Cannot be combined with        |
+    |              | live_update.                                              |
+    +--------------+-----------------------------------------------------------+
     """
 
     _TRACE_BLOCK_START = bytes([Header.TRACE_BLOCK.value, 0])
 
+    # Maximum number of bytes of consecutive traces that are composed before writing them at once
+    WRITE_BLOCK_SIZE = 4 * 1024 * 1024
+
+    # Maximum number of bytes the file grows by beyond the traces that are written
+    MAX_RESERVE_SIZE = 64 * 1024 * 1024
+
+    # Minimum number of bytes of a read for which the pages are prefetched up-front
+    PREFETCH_SIZE = 8 * 1024 * 1024
+
     def __init__(self, path, mode='x', **options):
         self.path = path if type(path) is str else str(path)
+        # All reads and writes go through the handle (an mmap of the file), the file handle
+        # only backs it and is used to synchronize the file to disk
         self.handle = None
         self.file_handle = None
 
         self.traceblock_offset = None
         self.sample_length = None
         self.trace_length = None
-
-        self.is_mmap_synched = False
+        self.record_dtype = None
 
         # Initialize empty dictionaries
         self.headers = {}
@@ -114,6 +192,13 @@ class TrsEngine(Engine):
         headers = options.get('headers', None)
         self.live_update = int(options.get('live_update', False))
         self.live_update_count = 0
+        self.live_update_offset = None
+        self.durable = bool(options.get('durable', True))
+        self.capacity = int(options.get('capacity', 0))
+        if self.capacity < 0:
+            raise ValueError('TrsFile requires a capacity of zero or more traces')
+        if self.capacity > 0 and self.live_update != 0:
+            raise ValueError('TrsFile cannot reserve a capacity when live_update is used')
         self.padding_mode = options.get('padding_mode', TracePadding.AUTO)
         if not isinstance(self.padding_mode, TracePadding):
             raise TypeError('TrsFile requires padding_mode to be of type \'TracePadding\'')
@@ -225,44 +310,68 @@ class TrsEngine(Engine):
     def has_trace_data(self) -> bool:
         return self.traceblock_offset is not None and self.handle.size() > self.traceblock_offset
 
-    def update_headers_with_traces_metadata(self, traces: List[Trace]) -> None:
+    def update_headers_with_traces_metadata(self, traces: List[Trace],
+                                            serialized_parameters: Optional[List[bytes]] = None) -> None:
+        # Serialize the parameters, unless the caller already did so
+        if serialized_parameters is None:
+            serialized_parameters = [trace.parameters.serialize() for trace in traces]
+
         # Check if any of the following headers are NOT initialized:
         # - NUMBER_SAMPLES
         # - LENGTH_DATA
         # - TITLE_SPACE
         # For any of these uninitialized headers, check if all traces are the same
         # for these fields, and set them to that value.
+        # Gather the metadata of all traces in a single pass
+        number_samples = 0
+        title_space = 0
+        data_length = len(serialized_parameters[0])
+        sample_coding = traces[0].sample_coding
+        check_data_length = self.headers[Header.LENGTH_DATA] is None
+        check_sample_coding = self.headers[Header.SAMPLE_CODING] is None
+        for trace, data in zip(traces, serialized_parameters):
+            if len(trace) > number_samples:
+                number_samples = len(trace)
+            if len(trace.title) > title_space:
+                title_space = len(trace.title)
+            if check_data_length and len(data) != data_length:
+                raise TypeError('Traces have different data length, this is not supported in TRS files')
+            if check_sample_coding and trace.sample_coding != sample_coding:
+                raise TypeError('Traces have different sample coding, this is not supported in TRS files')
+
         headers_updates = {}
         if self.headers[Header.NUMBER_SAMPLES] is None:
-            lengths = set([len(trace) for trace in traces])
+            headers_updates[Header.NUMBER_SAMPLES] = number_samples
 
-            # Check padding mode on how we are going to do this
-            headers_updates[Header.NUMBER_SAMPLES] = max(lengths)
-
-        if self.headers[Header.LENGTH_DATA] is None:
-            if len(set([len(trace.parameters.serialize()) for trace in traces])) > 1:
-                raise TypeError('Traces have different data length, this is not supported in TRS files')
-
-            headers_updates[Header.LENGTH_DATA] = len(traces[0].parameters.serialize())
+        if check_data_length:
+            headers_updates[Header.LENGTH_DATA] = data_length
 
         # Add a TraceParameterDefinitionMap if none is present, and verify its validity if one is present
         if Header.TRACE_PARAMETER_DEFINITIONS not in self.headers:
             headers_updates[Header.TRACE_PARAMETER_DEFINITIONS] = \
                 TraceParameterDefinitionMap.from_trace_parameter_map(traces[0].parameters)
         else:
+            # The outcome of matches() only depends on the layout of the parameters, so
+            # only traces with a layout that has not been verified yet are checked
+            definitions = self.headers[Header.TRACE_PARAMETER_DEFINITIONS]
+            matching_layouts = set()
             for index, trace in enumerate(traces):
-                if not trace.parameters.matches(self.headers[Header.TRACE_PARAMETER_DEFINITIONS]):
+                layout = (type(trace.parameters),) + tuple(
+                    (key, type(value), len(value)) for key, value in trace.parameters.items())
+                if layout in matching_layouts:
+                    continue
+                if trace.parameters.matches(definitions):
+                    matching_layouts.add(layout)
+                else:
                     raise TypeError(f"The parameters of trace #{index} do not match the trace set's definitions.\n"
                                     f"Please make sure the trace parameters match those of the other traces in type, "
                                     f"size and name.")
 
-        if self.headers[Header.SAMPLE_CODING] is None:
-            if len(set([trace.sample_coding for trace in traces])) > 1:
-                raise TypeError('Traces have different sample coding, this is not supported in TRS files')
-            headers_updates[Header.SAMPLE_CODING] = traces[0].sample_coding
+        if check_sample_coding:
+            headers_updates[Header.SAMPLE_CODING] = sample_coding
 
         if self.headers[Header.TITLE_SPACE] is None:
-            headers_updates[Header.TITLE_SPACE] = max([len(trace.title) for trace in traces])
+            headers_updates[Header.TITLE_SPACE] = title_space
 
         # Now update headers
         self.update_headers(headers_updates)
@@ -289,8 +398,14 @@ class TrsEngine(Engine):
         if len(indexes) <= 0:
             return
 
+        # The lowest and highest index, without iterating over the range
+        first_index, last_index = min(indexes[0], indexes[-1]), max(indexes[0], indexes[-1])
+
+        # Serialize the parameters of every trace only once
+        serialized_parameters = [trace.parameters.serialize() for trace in traces]
+
         if self.padding_mode == TracePadding.AUTO:
-            self.update_headers_with_traces_metadata(traces)
+            self.update_headers_with_traces_metadata(traces, serialized_parameters)
         elif self.padding_mode == TracePadding.NONE:
             # We need to verify if all required headers are set, else throw an error
             required_headers = [Header.NUMBER_SAMPLES, Header.LENGTH_DATA, Header.SAMPLE_CODING, Header.TITLE_SPACE]
@@ -314,118 +429,241 @@ class TrsEngine(Engine):
             self.trace_length = self.sample_length + self.headers.get(Header.LENGTH_DATA, 0) + self.headers.get(
                 Header.TITLE_SPACE, 0)
 
-        # Store all traces with the next sequence numbers and keep these numbers as a list
-        for i, trace in zip(indexes, traces):
-            # Update the trace headers to be a reference to our internal headers because that is how it is!
-            trace.headers = self.headers
-
-            # Check padding mode
-            if self.padding_mode == TracePadding.NONE and len(trace) != self.headers[Header.NUMBER_SAMPLES]:
-                raise ValueError('Trace has a different length from the expected length and padding mode is NONE')
+        # Make sure the file can hold all traces that are written. When a capacity is given, reserve that capacity
+        # or double the trace block (up to MAX_RESERVE_SIZE) to avoid resizing for every trace.
+        file_size = self.traceblock_offset + (last_index + 1) * self.trace_length
+        current_size = self.handle.size()
+        if current_size < file_size:
+            if self.capacity > 0:
+                reserve_size = min(current_size - self.traceblock_offset, self.MAX_RESERVE_SIZE)
+                file_size = max(file_size, self.traceblock_offset + self.capacity * self.trace_length,
+                                current_size + reserve_size)
+            self.handle.resize(file_size)
+
+        # Traces are composed in a block of records: title, parameter data and samples. Consecutive traces
+        # are collected in the block and written with a single copy. The block is deliberately not a view on
+        # the mmap: an exported buffer makes resizing or closing the mmap fail.
+        if self.record_dtype is None:
+            self.record_dtype = self.__create_record_dtype()
+        title_space = self.headers[Header.TITLE_SPACE]
+        number_samples = self.headers[Header.NUMBER_SAMPLES]
+        data_length = self.trace_length - self.sample_length - title_space
+        block_count = max(1, min(len(traces), self.WRITE_BLOCK_SIZE // max(1, self.trace_length)))
+        block = numpy.zeros(block_count, self.record_dtype)
+
+        # Bind everything that is used for every trace to locals
+        headers = self.headers
+        check_length = self.padding_mode == TracePadding.NONE
+
+        # Only consecutive traces can be written as one block
+        chunk_size = block_count if indexes.step == 1 else 1
+        for chunk in range(0, len(traces), chunk_size):
+            chunk_traces = traces[chunk:chunk + chunk_size]
+            chunk_data = serialized_parameters[chunk:chunk + chunk_size]
+            records = block[:len(chunk_traces)]
+
+            # Titles, the zero padding is added by the bytes string dtype
+            titles = [trace.title.strip().encode('utf-8') for trace in chunk_traces]
+            if any(len(title) > title_space for title in titles):
+                raise TypeError('Trace title is longer than available title space')
+            if title_space > 0:
+                records['title'] = titles
 
-            # Seek to the beginning of the trace (this automatically enables us to overwrite)
-            self.file_handle.seek(self.traceblock_offset + i * self.trace_length)
+            # Parameters, padded in the same way
+            if any(len(data) > data_length for data in chunk_data):
+                raise TypeError('Trace data is longer than the data length of the trace set')
+            if data_length > 0:
+                records['data'].view(f'S{data_length}')[:] = [bytes(data) for data in chunk_data]
 
-            # Title and title padding
-            title = trace.title.strip().encode('utf-8')
-            if len(title) > self.headers[Header.TITLE_SPACE]:
-                raise TypeError('Trace title is longer than available title space')
-            self.file_handle.write(title)
-            if len(title) < self.headers[Header.TITLE_SPACE]:
-                self.file_handle.write(bytes(self.headers[Header.TITLE_SPACE] - len(title)))
+            # Update the trace headers to be a reference to our internal headers because that is how it is!
+            chunk_samples = []
+            for trace in chunk_traces:
+                trace.headers = headers
+                chunk_samples.append(trace.samples)
+
+            if all(len(samples) == number_samples for samples in chunk_samples):
+                # Copy the samples of all traces at once
+                if number_samples > 0:
+                    numpy.stack(chunk_samples, out=records['samples'], casting='unsafe')
+            else:
+                # Check padding mode
+                if check_length:
+                    raise ValueError('Trace has a different length from the expected length and padding mode is NONE')
 
-            # Parameters
-            self.file_handle.write(trace.parameters.serialize())
+                # Automatic truncate and add any required padding
+                for samples, row_samples in zip(chunk_samples, records['samples']):
+                    length = min(len(samples), number_samples)
+                    row_samples[:length] = samples[:length]
+                    row_samples[length:] = 0
 
-            # Automatic truncate
-            trace.samples[:self.headers[Header.NUMBER_SAMPLES]].tofile(self.file_handle)
+            self.__write_block(self.traceblock_offset + indexes[chunk] * self.trace_length, records)
 
-            # Add any required padding
-            length = (self.headers[Header.NUMBER_SAMPLES] - len(trace.samples)) * self.headers[
-                Header.SAMPLE_CODING].size
-            if length > 0:
-                self.file_handle.write(length * b'\x00')
+        # Keep track of the first trace that is not yet flushed by a live update
+        if self.live_update != 0 and self.durable:
+            offset = self.traceblock_offset + first_index * self.trace_length
+            if self.live_update_offset is None or offset < self.live_update_offset:
+                self.live_update_offset = offset
 
         # Write the new total number of traces
         # If you want to have live update, you can give this flag and have this
         # automatically write to the file
-        new_number_traces = max(self.headers[Header.NUMBER_TRACES], max(indexes) + 1)
+        new_number_traces = max(self.headers[Header.NUMBER_TRACES], last_index + 1)
         if self.headers[Header.NUMBER_TRACES] < new_number_traces:
-            self.is_mmap_synched = False
             self.live_update_count += len(traces)
 
             if self.live_update != 0 and self.live_update_count >= self.live_update:
                 self.live_update_count = 0
-                self.update_header(Header.NUMBER_TRACES, new_number_traces)
+                self.headers[Header.NUMBER_TRACES] = new_number_traces
+                self.__write_number_traces()
 
-                # Force flush
-                self.handle.flush()
+                # Force flush of only the updated header and the traces written since the last update
+                if self.durable:
+                    self.__flush_range(*self.header_locations[Header.NUMBER_TRACES])
+                    self.__flush_range(self.live_update_offset, self.handle.size() - self.live_update_offset)
+                    self.live_update_offset = None
                 self.file_handle.flush()
-                os.fsync(self.file_handle.fileno())
+                if self.durable:
+                    _fdatasync(self.file_handle.fileno())
             else:
                 self.headers[Header.NUMBER_TRACES] = new_number_traces
 
-    def get_traces(self, index: Union[slice, int]) -> List[Trace]:
+    def __write_block(self, offset: int, block: numpy.ndarray):
+        """Writes composed traces to the file (this automatically enables us to overwrite)"""
+        self.handle[offset:offset + block.nbytes] = block
+
+    def __write_number_traces(self):
+        """Writes the NUMBER_TRACES header in place, its location is known once the headers are written"""
+        offset, length = self.header_locations[Header.NUMBER_TRACES]
+        self.handle[offset:offset + length] = self.headers[Header.NUMBER_TRACES].to_bytes(
+            length, byteorder='little', signed=length >= 4)
+
+    def __flush_range(self, offset: int, size: int):
+        """Flushes a range of the file, the offset is aligned to the page boundary as mmap requires"""
+        aligned_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self.handle.flush(aligned_offset, size + offset - aligned_offset)
+
+    def __get_indexes(self, index: Union[slice, int]) -> range:
         # check for slicing
         if isinstance(index, slice):
             # No bounds checking when using slices, that's how python rolls!
-            indexes = range(*index.indices(self.length()))
-        else:
-            # Wrap around for negative index
-            if index < 0:
-                index = index % self.length()
-
-            # Check if we are still in bounds
-            if index >= self.length():
-                raise IndexError('List index out of range')
+            return range(*index.indices(self.length()))
 
-            indexes = range(index, index + 1)
+        # Wrap around for negative index
+        if index < 0:
+            index = index % self.length()
 
-        # We need to resize the mmap if we added something directly on the file handle
-        # We do it here for optimization purposes, if you do not read, no resizing :)
-        if not self.is_mmap_synched and not self.read_only:
-            total_file_size = self.traceblock_offset + (self.length() + 1) * self.trace_length
-            if self.handle.size() < total_file_size:
-                self.handle.resize(total_file_size)
-            self.is_mmap_synched = True
+        # Check if we are still in bounds
+        if index >= self.length():
+            raise IndexError('List index out of range')
 
-        # Now read in all traces
-        traces = []
-        for i in indexes:
-            # Seek to the beginning of the trace
-            self.handle.seek(self.traceblock_offset + i * self.trace_length)
+        return range(index, index + 1)
 
-            # Read the title
-            if Header.TITLE_SPACE in self.headers:
-                title = self.handle.read(self.headers[Header.TITLE_SPACE]).rstrip(b'\x00').decode('utf-8')
-            else:
-                title = ''  # No title
+    def get_traces(self, index: Union[slice, int]) -> List[Trace]:
+        records = self.__read_indexes(self.__get_indexes(index))
+        sample_coding = self.headers[Header.SAMPLE_CODING]
+        samples = records['samples']
 
-            parameters = self.read_parameter_data()
+        # Convert all titles to bytes at once, a bytes string dtype already drops the trailing zero padding
+        if 'title' in self.record_dtype.names:
+            titles = [title.decode('utf-8') for title in records['title'].tolist()]
+        else:
+            titles = [''] * len(records)
+        data = records['data'] if 'data' in self.record_dtype.names else None
 
-            # Read all the samples
-            samples = numpy.frombuffer(self.handle.read(self.trace_length), self.headers[Header.SAMPLE_CODING].format,
-                                       self.headers[Header.NUMBER_SAMPLES])
+        # Look up the parameter definitions once for all traces
+        headers = self.headers
+        definitions = headers[Header.TRACE_PARAMETER_DEFINITIONS] if self.has_parameter_definitions() else None
 
-            traces.append(Trace(self.headers[Header.SAMPLE_CODING], samples, parameters, title, self.headers))
+        traces = []
+        for i in range(len(records)):
+            trace_data = data[i].tobytes() if data is not None else b''
+            if definitions is not None:
+                parameters = TraceParameterMap.deserialize(trace_data, definitions)
+            else:
+                parameters = self.parse_parameter_data(trace_data)
+            traces.append(Trace(sample_coding, samples[i], parameters, titles[i], headers))
 
         return traces
 
+    def get_samples(self, index: Union[slice, int]) -> numpy.ndarray:
+        return self.__read_indexes(self.__get_indexes(index))['samples']
+
+    def __read_indexes(self, indexes: range) -> numpy.ndarray:
+        """Read the records of the traces, consecutive traces are read as one block, otherwise every trace is read
+        separately"""
+        if indexes.step == 1 or len(indexes) <= 1:
+            return self.__read_records(indexes.start, len(indexes))
+        return numpy.concatenate([self.__read_records(i, 1) for i in indexes])
+
+    def __read_records(self, start: int, count: int) -> numpy.ndarray:
+        """Read a number of consecutive traces with a single read, every record is a trace: title, parameter data
+        and samples"""
+        if self.record_dtype is None:
+            self.record_dtype = self.__create_record_dtype()
+
+        offset = self.traceblock_offset + start * self.trace_length
+        size = count * self.trace_length
+
+        # Let the kernel read large blocks ahead at once instead of faulting them in page by page. The block is
+        # read front to back, so only for this range the kernel may also read further ahead and drop pages behind.
+        sequential = False
+        if size >= self.PREFETCH_SIZE and isinstance(self.handle, mmap.mmap) and hasattr(mmap, 'MADV_WILLNEED'):
+            aligned_offset = offset - offset % mmap.PAGESIZE
+            aligned_size = size + offset - aligned_offset
+            self.handle.madvise(mmap.MADV_WILLNEED, aligned_offset, aligned_size)
+            sequential = hasattr(mmap, 'MADV_SEQUENTIAL') and hasattr(mmap, 'MADV_NORMAL')
+            if sequential:
+                self.handle.madvise(mmap.MADV_SEQUENTIAL, aligned_offset, aligned_size)
+
+        # Slicing does not use the file position, so reads do not interfere with each other
+        block = self.handle[offset:offset + size]
+
+        # The block has been copied, restore the default advice so later random access to these pages is not hurt
+        if sequential:
+            self.handle.madvise(mmap.MADV_NORMAL, aligned_offset, aligned_size)
+        return numpy.frombuffer(block, self.record_dtype, count)
+
+    def __create_record_dtype(self) -> numpy.dtype:
+        """Creates a structured dtype that describes the layout of a single trace in the file"""
+        title_space = self.headers.get(Header.TITLE_SPACE, 0)
+        data_end = self.trace_length - self.sample_length
+        fields = {'names': [], 'formats': [], 'offsets': [], 'itemsize': self.trace_length}
+        if title_space > 0:
+            fields['names'].append('title')
+            fields['formats'].append(f'S{title_space}')
+            fields['offsets'].append(0)
+        if data_end > title_space:
+            fields['names'].append('data')
+            fields['formats'].append(f'V{data_end - title_space}')
+            fields['offsets'].append(title_space)
+        fields['names'].append('samples')
+        fields['formats'].append((self.headers[Header.SAMPLE_CODING].format, (self.headers[Header.NUMBER_SAMPLES],)))
+        fields['offsets'].append(data_end)
+        return numpy.dtype(fields)
+
+    def has_parameter_definitions(self) -> bool:
+        return Header.TRS_VERSION in self.headers \
+            and self.headers[Header.TRS_VERSION] > 1 \
+            and Header.TRACE_PARAMETER_DEFINITIONS in self.headers
+
     def read_parameter_data(self) -> TraceParameterMap:
         # Read the trace parameters
-        if Header.TRS_VERSION in self.headers \
-                and self.headers[Header.TRS_VERSION] > 1 \
-                and Header.TRACE_PARAMETER_DEFINITIONS in self.headers:
-            definitions = self.headers[Header.TRACE_PARAMETER_DEFINITIONS]
-            data = self.handle.read(definitions.get_total_size())
-            parameters = TraceParameterMap.deserialize(data, definitions)
+        if self.has_parameter_definitions():
+            data = self.handle.read(self.headers[Header.TRACE_PARAMETER_DEFINITIONS].get_total_size())
+        elif Header.LENGTH_DATA in self.headers:
+            data = self.handle.read(self.headers[Header.LENGTH_DATA])
+        else:
+            data = b''
+        return self.parse_parameter_data(data)
+
+    def parse_parameter_data(self, data: bytes) -> TraceParameterMap:
+        if self.has_parameter_definitions():
+            parameters = TraceParameterMap.deserialize(data, self.headers[Header.TRACE_PARAMETER_DEFINITIONS])
         else:
             parameters = TraceParameterMap()
-            # Read (legacy) data
-            if Header.LENGTH_DATA in self.headers:
-                data = self.handle.read(self.headers[Header.LENGTH_DATA])
-                if data:
-                    parameters['LEGACY_DATA'] = ByteArrayParameter(data)
+            # Interpret (legacy) data
+            if data:
+                parameters['LEGACY_DATA'] = ByteArrayParameter(data)
         return parameters
 
     def close(self):
@@ -435,7 +673,13 @@ class TrsEngine(Engine):
         if self.handle is not None and not self.handle.closed:
             # Make sure we write all headers to the file
             if not self.read_only:
-                self.__write_headers({Header.NUMBER_TRACES: self.headers[Header.NUMBER_TRACES]})
+                self.__write_number_traces()
+
+                # Release any space that was reserved beyond the last trace
+                if self.trace_length is not None:
+                    file_size = self.traceblock_offset + self.headers[Header.NUMBER_TRACES] * self.trace_length
+                    if self.handle.size() > file_size:
+                        self.handle.resize(file_size)
 
             # Flush the mmap (according to docs this is important) and close
             self.handle.flush()
@@ -464,7 +708,7 @@ class TrsEngine(Engine):
             self.headers[Header.SAMPLE_CODING] = None
 
         # Add any mandatory headers that are missing
-        for header in Header.get_mandatory():
+        for header in _MANDATORY_HEADERS:
             if header not in self.headers:
                 self.headers[header] = header.default
 
@@ -504,7 +748,8 @@ class TrsEngine(Engine):
         if len(headers) <= 0:
             return
 
-        # Save the headers
+        # Save the headers, new headers are collected to be written at once
+        new_tags = []
         for header, value in headers.items():
             # Skip TRACE_BLOCK header as we write that last!
             if header == Header.TRACE_BLOCK:
@@ -515,30 +760,14 @@ class TrsEngine(Engine):
                 raise TypeError('Cannot write unknown header to trace set')
 
             # Obtain the tag value
-            if header.type is int:
-                # Note the delicacy with the signedness here.
-                tag_value = b'\xff' * header.length if value is None else value.to_bytes(header.length, byteorder='little', signed=header.length >= 4)
-            elif header.type is float:
-                tag_value = struct.pack('<f', 0.0 if value is None else value)
-            elif header.type is bool:
-                tag_value = struct.pack('<?', 0 if value is None else value)
-            elif header.type is str:
-                tag_value = value.encode('utf-8')
-            elif header.type is SampleCoding:
-                tag_value = b'\xff' if value is None else value.value.to_bytes(1, byteorder='little', signed=False)
-            elif header.type is bytes:
-                tag_value = value
-            elif header.type is TraceSetParameterMap:
+            encoder = _HEADER_ENCODERS.get(header.type)
+            if encoder is None:
+                raise TypeError('Header has a type that can not be serialized')
+            if header.type is TraceSetParameterMap:
                 # update the trace set parameter map with data from the header and with defaults
                 value.fill_from_headers(self.headers)
                 value.add_defaults()
-                tag_value = value.serialize()
-                value.lock_content()
-            elif header.type is TraceParameterDefinitionMap:
-                tag_value = value.serialize()
-                value.lock_content()
-            else:
-                raise TypeError('Header has a type that can not be serialized')
+            tag_value = encoder(header, value)
 
             # The tag length is easy!
             tag_length = len(tag_value)
@@ -552,37 +781,41 @@ class TrsEngine(Engine):
                 offset = self.header_locations[header][0]
                 self.handle[offset : offset + len(tag_value)] = tag_value
             else:
-                # Construct the TLV
-                tag = [header.value]
+                # Construct the TLV in one go
                 if tag_length >= 0x80:
-                    tag_length_length = (tag_length.bit_length() // 8) + (1 if tag_length.bit_length() % 8 > 0 else 0)
-                    tag += bytes([0x80 | tag_length_length]) + tag_length.to_bytes(tag_length_length, byteorder='little', signed=tag_length_length >= 4)
+                    tag_length_length = (tag_length.bit_length() + 7) // 8
+                    tag = bytes([header.value, 0x80 | tag_length_length]) \
+                        + tag_length.to_bytes(tag_length_length, byteorder='little', signed=tag_length_length >= 4) \
+                        + tag_value
                 else:
-                    tag += [tag_length]
-                tag += tag_value
-
-                # If the TRACE_BLOCK was already saved, overwrite it with the TRACE_BLOCK
-                if Header.TRACE_BLOCK in self.header_locations:
-                    self.handle.seek(self.traceblock_offset - len(TrsEngine._TRACE_BLOCK_START))
-                    self.header_locations.pop(Header.TRACE_BLOCK)
-                    self.traceblock_offset = None
-
-                # Store this index for future references
-                if self.handle.size() < self.handle.tell() + len(tag):
-                    self.handle.resize(self.handle.tell() + len(tag))
-                self.handle.write(bytes(tag))
-                self.header_locations[header] = (self.handle.tell() - len(tag_value), tag_length)
-
-        # Save the TRACE_BLOCK if not already saved
-        if Header.TRACE_BLOCK not in self.header_locations:
-            # Write the TRACE_BLOCK
-            if self.handle.size() < self.handle.tell() + len(TrsEngine._TRACE_BLOCK_START):
-                self.handle.resize(self.handle.tell() + len(TrsEngine._TRACE_BLOCK_START))
-            self.handle.write(TrsEngine._TRACE_BLOCK_START)
-
-            # Calculate offset
-            self.traceblock_offset = self.handle.tell()
-            self.header_locations[Header.TRACE_BLOCK] = (self.handle.tell(), 0)
+                    tag = bytes([header.value, tag_length]) + tag_value
+
+                new_tags.append((header, tag, tag_length))
+
+        # New headers are written at once, followed by the TRACE_BLOCK
+        if len(new_tags) > 0 or Header.TRACE_BLOCK not in self.header_locations:
+            # If the TRACE_BLOCK was already saved, overwrite it with the new headers
+            if Header.TRACE_BLOCK in self.header_locations:
+                self.handle.seek(self.traceblock_offset - len(TrsEngine._TRACE_BLOCK_START))
+                self.header_locations.pop(Header.TRACE_BLOCK)
+                self.traceblock_offset = None
+
+            # Resize the file only once for all headers
+            tags = b''.join(tag for _, tag, _ in new_tags) + TrsEngine._TRACE_BLOCK_START
+            position = self.handle.tell()
+            end = position + len(tags)
+            if self.handle.size() < end:
+                self.handle.resize(end)
+            self.handle.write(tags)
+
+            # Store the indices for future references
+            for header, tag, tag_length in new_tags:
+                position += len(tag)
+                self.header_locations[header] = (position - tag_length, tag_length)
+
+            # The trace block starts right after the headers
+            self.traceblock_offset = end
+            self.header_locations[Header.TRACE_BLOCK] = (self.traceblock_offset, 0)
         elif self.traceblock_offset is None:
             # This should never happen, but who knows?!
             raise NotImplementedError('Trace block offset is still None but TRACE_BLOCK TLV already in headers?!?!?!')
@@ -592,45 +825,33 @@ class TrsEngine(Engine):
         self.headers = {}
         self.header_locations = {}
 
-        # Jump to the beginning of the file (should contain TLV)
-        self.handle.seek(0)
-
-        # Parse all headers until the TRACE_BLOCK
+        # Parse all headers until the TRACE_BLOCK, indexing the file directly from the beginning (should contain TLV)
+        handle = self.handle
+        pos = 0
         while Header.TRACE_BLOCK not in self.headers:
-            # Obtain the Tag
-            tag = self.handle.read(1)[0]
-
-            # Obtain the Length
-            tag_length = self.handle.read(1)[0]
+            # Obtain the Tag and the Length
+            tag = handle[pos]
+            tag_length = handle[pos + 1]
+            pos += 2
 
             if (tag_length & 0x80) != 0:
-                tag_length &= 0x7F
-                tag_length = int.from_bytes(self.handle.read(tag_length), byteorder='little', signed=tag_length >= 4)
+                length_size = tag_length & 0x7F
+                tag_length = int.from_bytes(handle[pos:pos + length_size], byteorder='little', signed=length_size >= 4)
+                pos += length_size
             if tag_length == 0 and tag != Header.TRACE_BLOCK.value:
                 continue
 
             # Obtain the Value
-            tag_value_index = self.handle.tell()
-            tag_value = self.handle.read(tag_length) if tag_length > 0 else None
+            tag_value_index = pos
+            tag_value = handle[pos:pos + tag_length] if tag_length > 0 else None
+            pos += tag_length
 
             # Interpret it
-            header = None
-            if Header.has_value(tag):
-                header = Header(tag)
-                if header.type is int:
-                    tag_value = int.from_bytes(tag_value, byteorder='little', signed=tag_length >= 4)
-                elif header.type is float:
-                    tag_value, = struct.unpack('<f', tag_value)
-                elif header.type is bool:
-                    tag_value, = struct.unpack('<?', tag_value)
-                elif header.type is str:
-                    tag_value = tag_value.decode('utf-8')
-                elif header.type is SampleCoding:
-                    tag_value = SampleCoding(tag_value[0])
-                elif header.type is TraceSetParameterMap:
-                    tag_value = TraceSetParameterMap.deserialize(BytesIO(tag_value))
-                elif header.type is TraceParameterDefinitionMap:
-                    tag_value = TraceParameterDefinitionMap.deserialize(BytesIO(tag_value))
+            header = _HEADERS_BY_TAG.get(tag)
+            if header is not None:
+                decoder = _HEADER_DECODERS.get(header.type)
+                if decoder is not None:
+                    tag_value = decoder(tag_value)
             else:
                 if not self.ignore_unknown_tags:
                     error_msg = 'Warning: tag 0x{tag:02X} is not supported by the library, if you believe ' \
@@ -644,17 +865,16 @@ class TrsEngine(Engine):
             self.header_locations[tag if header is None else header] = (tag_value_index, tag_length)
 
         # Sanity: Check if we have all mandatory headers, if not, throw an error if we are in reading mode!
-        if not Header.get_mandatory().issubset(self.headers):
+        if not _MANDATORY_HEADERS.issubset(self.headers):
             raise IOError('TRS file does not contain all mandatory headers')
 
         # Pre-compute some static information based on headers
-        self.traceblock_offset = self.handle.tell()
+        self.traceblock_offset = pos
         self.sample_length = self.headers[Header.NUMBER_SAMPLES] * self.headers[Header.SAMPLE_CODING].size
         self.trace_length = self.sample_length + self.headers.get(Header.LENGTH_DATA, 0) + self.headers.get(
             Header.TITLE_SPACE, 0)
 
         # Sanity: Check if the file has the proper size
-        self.handle.seek(0, os.SEEK_END)
-        file_size = self.handle.tell()
+        file_size = self.handle.size()
         if file_size != self.traceblock_offset + self.headers[Header.NUMBER_TRACES] * self.trace_length:
             raise IOError('TRS file has an unexpected length')
@@ -1,9 +1,13 @@
 from __future__ import annotations
 import copy
 import numbers
+import struct
 import warnings
+from collections import OrderedDict
 from typing import Any, Union, List, Dict, TYPE_CHECKING
 
+import numpy as np
+
 if TYPE_CHECKING:
     from trsfile.common import Header
 
@@ -26,18 +30,49 @@ from trsfile.traceparameter import (
     TraceSetParameter,
 )
 from trsfile.utils import (
-    encode_as_short,
-    read_parameter_name,
-    read_short,
     StringKeyOrderedDict,
     UTF_8,
+    read_parameter_name,
+    read_short,
 )
-from io import BytesIO
+from io import BytesIO, SEEK_CUR
 
 SHORT_MIN = -2**15
 SHORT_MAX = 2**15-1
 INT_MIN = -2**31
 INT_MAX = 2**31-1
+SHORT_BITS = 15
+INT_BITS = 31
+
+_SHORT = struct.Struct('<h')
+_TYPE_AND_LENGTH = struct.Struct('<Bh')
+_UNSIGNED_SHORT = struct.Struct('<H')
+_TYPE_AND_UNSIGNED_LENGTH = struct.Struct('<BH')
+
+# The concrete TraceParameter classes, to accept the common case without an isinstance check
+_PARAMETER_CLASSES = frozenset(param_type.param_class for param_type in ParameterType)
+
+# The type tag of each TraceParameter class, and whether its serialized length is counted in bytes
+_PARAMETER_TAGS = {param_type.param_class: (param_type.value, param_type is ParameterType.STRING)
+                   for param_type in ParameterType}
+
+
+def _deserialization_buffer(raw: Union[BytesIO, bytes]):
+    """Get a buffer with the data to deserialize, starting at the current position when deserializing from a BytesIO.
+    Other streams give None, as they may not be seekable and are read field by field instead, to only consume the
+    data of the map."""
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        return memoryview(raw)
+    if isinstance(raw, BytesIO):
+        return raw.getbuffer()[raw.tell():]
+    return None
+
+
+def _unpack_parameter_name(buffer, position: int):
+    """Get a length-prefixed parameter name from a buffer, and the position after that name"""
+    name_length, = _UNSIGNED_SHORT.unpack_from(buffer, position)
+    position += _UNSIGNED_SHORT.size
+    return str(buffer[position:position + name_length], UTF_8), position + name_length
 
 
 class ParameterMapUtil:
@@ -66,8 +101,9 @@ class ParameterMapUtil:
         int,
         ShortType
     ]
+    _RATIONAL_TYPES_RANK = {rational_type: rank for rank, rational_type in enumerate(_RATIONAL_TYPES_PRIORITY)}
 
-    SUPPORTED_TYPES = [
+    SUPPORTED_TYPES = frozenset([
         ShortType,
         int,
         LongType,
@@ -77,15 +113,15 @@ class ParameterMapUtil:
         bytes,
         bytearray,
         list
-    ]
+    ])
 
-    LISTABLE_TYPES = [
+    LISTABLE_TYPES = frozenset([
         ShortType,
         int,
         LongType,
         float,
         bool
-    ]
+    ])
 
     ParameterValueType = Union[int, float, bool, List[int], List[float], List[bool], bytes, bytearray, str]
     StrictParameterValueType = Union[List[int], List[float], List[bool], bytes, bytearray, str]
@@ -95,19 +131,26 @@ class ParameterMapUtil:
     def _get_type(value):
         result = type(value)
         # python doesn't differentiate between 16 bit, 32 bit and 64 bit ints, so we have to do it ourselves
-        if result is int and (value > INT_MAX or value < INT_MIN):
-            result = ParameterMapUtil.LongType
-        elif result is int and (SHORT_MIN <= value <= SHORT_MAX):
-            result = ParameterMapUtil.ShortType
+        if result is int:
+            # The number of bits needed besides the sign bit, as a two's complement value
+            bits = (~value if value < 0 else value).bit_length()
+            if bits > INT_BITS:
+                return ParameterMapUtil.LongType
+            if bits <= SHORT_BITS:
+                return ParameterMapUtil.ShortType
+            return int
         if result not in ParameterMapUtil.SUPPORTED_TYPES:
             raise TypeError(f"Unsupported type for a value of a trace(Set) parameter: {result}.")
         return result
 
     @staticmethod
     def _highest_priority_rational_type(type1, type2):
-        for rational_type in ParameterMapUtil._RATIONAL_TYPES_PRIORITY:
-            if type1 == rational_type or type2 == rational_type:
-                return rational_type
+        rank1 = ParameterMapUtil._RATIONAL_TYPES_RANK.get(type1)
+        rank2 = ParameterMapUtil._RATIONAL_TYPES_RANK.get(type2)
+        if rank1 is not None and (rank2 is None or rank1 <= rank2):
+            return type1
+        if rank2 is not None:
+            return type2
         # If neither input type is a rational type, raise an error.
         # This should never happen, as type-checking is done before this function is called
         raise TypeError(f"Cannot create a Number array from elements of types {type1.__name__} and {type2.__name__}")
@@ -118,32 +161,36 @@ class ParameterMapUtil:
         Trace(Set) parameter.
         Raises errors if elements don't share a type, or if lists of the found type may not be used as values
         of Trace(Set) parameters"""
-        result_type = None
-
-        for elem in input_list:
-            elem_type = ParameterMapUtil._get_type(elem)
-            if result_type is not None and elem_type != result_type:
-                # Types of array elements may only vary if they are all rational numbers
-                if elem_type in ParameterMapUtil._RATIONAL_TYPES_PRIORITY \
-                        and result_type in ParameterMapUtil._RATIONAL_TYPES_PRIORITY:
-                    result_type = ParameterMapUtil._highest_priority_rational_type(elem_type, result_type)
-                else:
-                    raise TypeError("A list that is used as Trace(set) parameter must have elements that share a type")
+        # The element types are collected in one pass, after which no element needs to be visited individually
+        elem_types = set(map(type, input_list))
+        if elem_types == {int}:
+            values = np.asarray(input_list)
+            if values.dtype.kind in 'iu':
+                lowest, highest = int(values.min()), int(values.max())
             else:
-                result_type = elem_type
-
-        if result_type not in ParameterMapUtil.LISTABLE_TYPES:
-            raise TypeError(f"Lists of the {result_type} type are not supported as values of trace(set) parameters")
-
-        return result_type
+                # Values that do not fit in 64 bits do not result in an integer array
+                lowest, highest = min(input_list), max(input_list)
+            return ParameterMapUtil._highest_priority_rational_type(ParameterMapUtil._get_type(lowest),
+                                                                    ParameterMapUtil._get_type(highest))
+        elif elem_types == {float} or elem_types == {float, int}:
+            return float
+        elif elem_types == {bool}:
+            return bool
+
+        # Types of array elements may only vary if they are all rational numbers, which is handled above
+        if len(elem_types) > 1:
+            raise TypeError("A list that is used as Trace(set) parameter must have elements that share a type")
+        result_type = next(iter(elem_types), None)
+        raise TypeError(f"Lists of the {result_type} type are not supported as values of trace(set) parameters")
 
     @staticmethod
     def get_typed_parameter(param_value: ParameterValueType) -> type:
         """Get the subclass of TraceParameter needed to hold a given value
         Throws an error if the value cannot be stored in any TraceParameter subclass"""
-        value_type = ParameterMapUtil._get_type(param_value)
-        if value_type is list:
+        if type(param_value) is list:
             value_type = ParameterMapUtil._get_type_of_list_elems(param_value)
+        else:
+            value_type = ParameterMapUtil._get_type(param_value)
         return ParameterMapUtil.TYPE_TO_PARAMETER[value_type]
 
     @staticmethod
@@ -166,18 +213,27 @@ class LockableDict(StringKeyOrderedDict):
         self._stop_if_locked()
         super().__delitem__(key)
 
+    def _from_items(self, items):
+        """Create an unlocked map of the same type from items that have been validated already"""
+        result = type(self)()
+        for key, value in items:
+            OrderedDict.__setitem__(result, key, value)
+        return result
+
     def __copy__(self):
-        result = type(self)({key: value for (key, value) in self.items()})
+        result = self._from_items(self.items())
         result._is_locked = self._is_locked
         return result
 
     def __deepcopy__(self, memo):
-        return type(self)({copy.deepcopy(key): copy.deepcopy(value) for (key, value) in self.items()})
+        # Keys are strings, and the values of the concrete parameter classes hold immutable elements, so a copy of
+        # their value is as good as a deep copy
+        return self._from_items((key, type(value)(copy.copy(value.value), skip_validation=True)
+                                 if type(value) in _PARAMETER_CLASSES else copy.deepcopy(value, memo))
+                                for (key, value) in self.items())
 
     def copy(self):
-        result = type(self)(super().copy())
-        result._is_locked = self._is_locked
-        return result
+        return self.__copy__()
 
     def pop(self, key):
         self._stop_if_locked()
@@ -214,7 +270,7 @@ class TraceSetParameterMap(LockableDict):
     }
 
     def __setitem__(self, key: str, value: Union[TraceParameter, TraceSetParameter]):
-        if not isinstance(value, TraceParameter) or type(value) is TraceSetParameter:
+        if type(value) not in _PARAMETER_CLASSES and not isinstance(value, TraceParameter):
             raise TypeError('The value for a TraceSetParameterMap entry must be a specific subclass'
                             ' of TraceParameter (e.g. ByteArrayParameter).')
         self._stop_if_locked()
@@ -280,44 +336,104 @@ class TraceSetParameterMap(LockableDict):
                 self.add_standard_parameter(key, value)
 
     @staticmethod
-    def deserialize(raw: BytesIO) -> TraceSetParameterMap:
+    def deserialize(raw: Union[BytesIO, bytes]) -> TraceSetParameterMap:
+        # Walk the data with a position, rather than reading every field from a stream
+        buffer = _deserialization_buffer(raw)
+        if buffer is None:
+            return TraceSetParameterMap._deserialize_stream(raw)
+        result = TraceSetParameterMap()
+        # Release the buffer when done, as a BytesIO cannot be resized while its buffer is exported
+        with buffer:
+            number_of_entries, = _UNSIGNED_SHORT.unpack_from(buffer, 0)
+            position = _UNSIGNED_SHORT.size
+            for _ in range(number_of_entries):
+                name, position = _unpack_parameter_name(buffer, position)
+                tag, param_length = _TYPE_AND_UNSIGNED_LENGTH.unpack_from(buffer, position)
+                position += _TYPE_AND_UNSIGNED_LENGTH.size
+                param_type = ParameterType(tag)
+                end = position + param_length * param_type.byte_size
+                value = param_type.param_class.deserialize_from_buffer(buffer[position:end], param_length)
+                position = end
+                # Writing `result[name] = value` would cause the overridden `__setitem__`
+                # method in the `TraceParameterMap` to be called. That overridden method
+                # does additional type checking. There is no need to do type checking
+                # when deserializing. So invoke the base class method explicitly.
+                StringKeyOrderedDict.__setitem__(result, name, value)
+        if isinstance(raw, BytesIO):
+            raw.seek(position, SEEK_CUR)
+        return result
+
+    @staticmethod
+    def _deserialize_stream(raw) -> TraceSetParameterMap:
         result = TraceSetParameterMap()
         number_of_entries = read_short(raw)
         for _ in range(number_of_entries):
             name = read_parameter_name(raw)
             value = TraceSetParameter.deserialize(raw)
-            # Writing `result[name] = value` would cause the overridden `__setitem__`
-            # method in the `TraceParameterMap` to be called. That overridden method
-            # does additional type checking. There is no need to do type checking
-            # when deserializing. So invoke the base class method explicitly.
+            # Skip the type checking of the overridden `__setitem__`, as in `deserialize`
             StringKeyOrderedDict.__setitem__(result, name, value)
         return result
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        number_of_entries = len(self)
-        out.extend(encode_as_short(number_of_entries))
+        # Serialize all entries first, so the result can be written into a buffer of the exact size
+        parameter_tags = _PARAMETER_TAGS
+        entries = []
+        size = _SHORT.size
         for name, param in self.items():
             encoded_name = name.encode(UTF_8)
-            out.extend(encode_as_short(len(encoded_name)))
-            out.extend(encoded_name)
-
-            param_type = ParameterType.from_class(type(param))
-            out.append(param_type.value)
+            param_class = type(param)
+            try:
+                tag, is_string = parameter_tags[param_class]
+            except KeyError:
+                raise TypeError('{} is not valid ParameterType class'.format(param_class.__name__)) from None
             serialized_value = param.serialize()
-            length = len(serialized_value) if param_type is ParameterType.STRING else len(param.value)
-            out.extend(encode_as_short(length))
-
-            out.extend(serialized_value)
+            length = len(serialized_value) if is_string else len(param.value)
+            entries.append((encoded_name, tag, length, serialized_value))
+            size += _SHORT.size + len(encoded_name) + _TYPE_AND_LENGTH.size + len(serialized_value)
+
+        out = bytearray(size)
+        pack_short = _SHORT.pack_into
+        pack_type_and_length = _TYPE_AND_LENGTH.pack_into
+        pack_short(out, 0, len(entries))
+        offset = _SHORT.size
+        for encoded_name, tag, length, serialized_value in entries:
+            name_end = offset + _SHORT.size + len(encoded_name)
+            pack_short(out, offset, len(encoded_name))
+            out[offset + _SHORT.size:name_end] = encoded_name
+            pack_type_and_length(out, name_end, tag, length)
+            offset = name_end + _TYPE_AND_LENGTH.size + len(serialized_value)
+            out[name_end + _TYPE_AND_LENGTH.size:offset] = serialized_value
         return bytes(out)
 
 
 class TraceParameterDefinitionMap(LockableDict):
+    # The sum of the sizes of all definitions and the layout of the parameters, computed on first use after the map
+    # has changed. Only changes made through the map clear them: after changing the type, length or offset of a
+    # definition in place, assign it to the map again (`definitions[name] = definitions[name]`).
+    _total_size = None
+    _layout = None
+
+    def _stop_if_locked(self):
+        super()._stop_if_locked()
+        # Every change to the content of the map passes here
+        self._total_size = None
+        self._layout = None
+
+    def _get_layout(self) -> tuple:
+        """Get the name, class, start, end and length of every parameter, to deserialize the parameters of a trace.
+        Like the total size, the layout is not updated when a definition is changed in place."""
+        if self._layout is None:
+            self._layout = tuple((name, param.param_type.param_class, param.offset,
+                                  param.offset + param.length * param.param_type.byte_size, param.length)
+                                 for name, param in self.items())
+        return self._layout
+
     def get_total_size(self) -> int:
-        total = 0
-        for param in self.values():
-            total += param.length * param.param_type.byte_size
-        return total
+        """Get the number of bytes needed to store the parameters of a trace. Changing the type, length or offset of
+        a definition in place does not update the cached size, assign the definition to the map again instead."""
+        if self._total_size is None:
+            self._total_size = sum(param.length * param.param_type.byte_size for param in self.values())
+        return self._total_size
 
     def __setitem__(self, key: str, value: TraceParameterDefinition):
         if type(value) is not TraceParameterDefinition:
@@ -359,20 +475,25 @@ class TraceParameterDefinitionMap(LockableDict):
         :return:       This TraceParameterDefinition map after adding the new definition
         """
         self._stop_if_locked()
+        shift = size * type.byte_size
         params_to_move_back = []
         for key, param in self.items():
             if param.offset >= offset:
-                param.offset += size * type.byte_size
+                param.offset += shift
                 params_to_move_back.append(key)
-            elif param.offset + param.length * param.param_type.byte_size > offset:
-                offset = param.offset + param.length * param.param_type.byte_size
-                warnings.warn("Given offset would put a parameter inside another trace parameter.\n"
-                              f"Increased the offset of the inserted parameter definition to {offset} to prevent this.")
+            else:
+                end = param.offset + param.length * param.param_type.byte_size
+                if end > offset:
+                    offset = end
+                    warnings.warn("Given offset would put a parameter inside another trace parameter.\n"
+                                  f"Increased the offset of the inserted parameter definition to {offset} to prevent "
+                                  f"this.")
 
         new_definition = TraceParameterDefinition(type, size, offset)
         self.__setitem__(name, new_definition)
+        # The map is known to be unlocked here, so move the definitions without checking that again
         for param in params_to_move_back:
-            self.move_to_end(param)
+            StringKeyOrderedDict.move_to_end(self, param)
         return self
 
     def append_std(self, name: str, size: int) -> TraceParameterDefinitionMap:
@@ -403,23 +524,50 @@ class TraceParameterDefinitionMap(LockableDict):
         return self
 
     @staticmethod
-    def deserialize(raw: BytesIO) -> TraceParameterDefinitionMap:
+    def deserialize(raw: Union[BytesIO, bytes]) -> TraceParameterDefinitionMap:
+        # Walk the data with a position, rather than reading every field from a stream
+        buffer = _deserialization_buffer(raw)
+        if buffer is None:
+            return TraceParameterDefinitionMap._deserialize_stream(raw)
+        result = TraceParameterDefinitionMap()
+        # Release the buffer when done, as a BytesIO cannot be resized while its buffer is exported
+        with buffer:
+            number_of_entries, = _UNSIGNED_SHORT.unpack_from(buffer, 0)
+            position = _UNSIGNED_SHORT.size
+            for _ in range(number_of_entries):
+                name, position = _unpack_parameter_name(buffer, position)
+                value = TraceParameterDefinition.unpack_from(buffer, position)
+                position += TraceParameterDefinition.SERIALIZED_SIZE
+                # The definition was just created, so skip the type checking of the overridden `__setitem__`
+                StringKeyOrderedDict.__setitem__(result, name, value)
+        if isinstance(raw, BytesIO):
+            raw.seek(position, SEEK_CUR)
+        return result
+
+    @staticmethod
+    def _deserialize_stream(raw) -> TraceParameterDefinitionMap:
         result = TraceParameterDefinitionMap()
         number_of_entries = read_short(raw)
         for _ in range(number_of_entries):
             name = read_parameter_name(raw)
             value = TraceParameterDefinition.deserialize(raw)
-            result[name] = value
+            StringKeyOrderedDict.__setitem__(result, name, value)
         return result
 
     def serialize(self) -> bytearray:
-        out = bytearray()
-        out.extend(encode_as_short(len(self)))
-        for name, value in self.items():
-            encoded_name = name.encode(UTF_8)
-            out.extend(encode_as_short(len(encoded_name)))
-            out.extend(encoded_name)
-            out.extend(value.serialize())
+        # Serialize all entries first, so the result can be written into a buffer of the exact size
+        entries = [(name.encode(UTF_8), value.serialize()) for name, value in self.items()]
+        out = bytearray(_SHORT.size + sum(_SHORT.size + len(encoded_name) + len(serialized_value)
+                                          for encoded_name, serialized_value in entries))
+        _SHORT.pack_into(out, 0, len(entries))
+        offset = _SHORT.size
+        for encoded_name, serialized_value in entries:
+            _SHORT.pack_into(out, offset, len(encoded_name))
+            offset += _SHORT.size
+            out[offset:offset + len(encoded_name)] = encoded_name
+            offset += len(encoded_name)
+            out[offset:offset + len(serialized_value)] = serialized_value
+            offset += len(serialized_value)
         return out
 
     @staticmethod
@@ -440,15 +588,17 @@ class TraceParameterDefinitionMap(LockableDict):
         for key, trace_param in trace_parameters.items():
             size = len(trace_param)
             param_type = ParameterType.from_class(type(trace_param))
-            result[key] = TraceParameterDefinition(param_type, size, offset)
+            # The definitions are created here, so skip the type checking of the overridden `__setitem__`
+            StringKeyOrderedDict.__setitem__(result, key, TraceParameterDefinition(param_type, size, offset))
             offset += size * param_type.byte_size
+        result._total_size = offset
         return result
 
 
 @aliased
 class TraceParameterMap(StringKeyOrderedDict):
     def __setitem__(self, key: str, value: TraceParameter):
-        if not isinstance(value, TraceParameter):
+        if type(value) not in _PARAMETER_CLASSES and not isinstance(value, TraceParameter):
             raise TypeError('The value for a TraceParameterMap entry must be a specific subclass'
                             ' of TraceParameter (e.g. ByteArrayParameter).')
         super().__setitem__(key, value)
@@ -495,11 +645,11 @@ class TraceParameterMap(StringKeyOrderedDict):
 
     @staticmethod
     def deserialize(raw: bytes, definitions: TraceParameterDefinitionMap) -> TraceParameterMap:
-        io_bytes = BytesIO(raw)
+        # Every parameter is deserialized from its own slice of the data, without copying the data
+        buffer = memoryview(raw)
         result = TraceParameterMap()
-        for key, val in definitions.items():
-            io_bytes.seek(val.offset)
-            param = val.param_type.param_class.deserialize(io_bytes, val.length)
+        for key, param_class, start, end, length in definitions._get_layout():
+            param = param_class.deserialize_from_buffer(buffer[start:end], length)
             # Writing `result[name] = value` would cause the overridden `__setitem__`
             # method in the `TraceParameterMap` to be called. That overridden method
             # does additional type checking. There is no need to do type checking
@@ -507,11 +657,8 @@ class TraceParameterMap(StringKeyOrderedDict):
             StringKeyOrderedDict.__setitem__(result, key, param)
         return result
 
-    def serialize(self) -> bytearray:
-        out = bytearray()
-        for val in self.values():
-            out.extend(val.serialize())
-        return out
+    def serialize(self) -> bytes:
+        return b''.join([val.serialize() for val in self.values()])
 
     def matches(self, definitions: TraceParameterDefinitionMap) -> bool:
         """Test whether this TraceParameterMap matches the associated definitions
@@ -521,30 +668,25 @@ class TraceParameterMap(StringKeyOrderedDict):
 
         :return:            A boolean that is true if the trace parameter definitions match the metadata of the trace
                             parameter map"""
-        match = True
+        if len(self) != len(definitions):
+            return False
+        # The parameters and definitions must be in the same order, so compare them pairwise
         offset = 0
-        matched_keys = []
-        for key, value in self.items():
-            if key not in definitions:
-                match = False
-            else:
-                definition = definitions[key]
-                matched_keys.append(key)
-                # Confirm the length, type and offset are correct
-                match = len(value) == definition.length
-                match &= ParameterType.from_class(type(value)) == definition.param_type
-                match &= definition.offset == offset
-                offset += len(value) * definition.param_type.byte_size
-            if not match:
-                break
-        match &= matched_keys == list(definitions.keys())
-        return match
+        for (key, value), (definition_key, definition) in zip(self.items(), definitions.items()):
+            # Confirm the name, length, type and offset are correct
+            if key != definition_key or len(value) != definition.length or definition.offset != offset \
+                    or ParameterType.from_class(type(value)) is not definition.param_type:
+                return False
+            offset += definition.length * definition.param_type.byte_size
+        return True
 
 
 class RawTraceData(TraceParameterMap):
     def __init__(self, data: bytes):
         super().__init__()
         super().__setitem__("LEGACY_DATA", ByteArrayParameter(data))
+        # Raw trace data cannot be changed, so its length is known from here on
+        self._data_length = len(self["LEGACY_DATA"])
 
     def __setitem__(self, key: str, value: TraceParameter):
         raise KeyError("Adding Trace Parameters into raw trace data is not allowed")
@@ -555,4 +697,4 @@ class RawTraceData(TraceParameterMap):
         :param definitions: The trace parameter definition map to check this raw trace data against
 
         :return:            A boolean that is true if the trace parameter definitions can interpret this raw trace data"""
-        return definitions.get_total_size() == len(self["LEGACY_DATA"])
+        return definitions.get_total_size() == self._data_length
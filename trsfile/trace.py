@@ -16,13 +16,15 @@ class Trace:
 	def __init__(self, sample_coding, samples, parameters=None, title='trace', headers=None, raw_data: bytes = bytes()):
 		""" Create a new Trace.
 		:param sample_coding: The encoding of all samples in the trace
-		:param samples: The array of samples of the trace
+		:param samples: The array of samples of the trace, or a callable that returns it. A callable is only invoked
+			when the samples are accessed for the first time.
 		:param parameters: The trace parameter map that contains the trace's data and its meta information. Do not use
 			in combination with raw_data
 		:param title: The title of the trace
 		:param headers: The headers of the trs file to which this trace will be added. This is an optional parameter;
 			information from the headers may define the locations of the input, output and key data in the trace data,
-			but it is recommended to store that information in the trace parameter map now.
+			but it is recommended to store that information in the trace parameter map now. The dictionary is referenced,
+			not copied, so all traces of a trace set share the headers of that trace set.
 		:param raw_data: A byte array with the raw trace data. Do not use in combination with parameters. If used, it is
 			recommended that a TraceParameterDefinitionMap is added to the headers of the trsfile that defines the meta
 			information of this raw trace data.
@@ -48,22 +50,51 @@ class Trace:
 			raise TypeError('Trace requires sample_coding to be of type \'SampleCoding\'')
 		self.sample_coding = sample_coding
 
+		# Samples can be loaded on first access
+		if callable(samples):
+			self.__samples_loader = samples
+			self.__samples = None
+		else:
+			self.__samples_loader = None
+			self.__samples = self.__to_samples(samples)
+
+		# Optional headers to add meta support to data slicing (get_input etc)
+		self.headers = headers
+
+	def __setstate__(self, state):
+		# Traces pickled before samples could be loaded on first access hold their samples in a plain attribute
+		if 'samples' in state:
+			state = dict(state)
+			state['_Trace__samples'] = state.pop('samples')
+			state['_Trace__samples_loader'] = None
+		self.__dict__.update(state)
+
+	def __to_samples(self, samples):
 		# Read in the sample and cast them automatically to the correct type
 		# which is always a numpy.array with a specific dtype as indicated in sample_coding
 		if isinstance(samples, numpy.ndarray):
 			# Check if we need to convert the type of the numpy array
-			if samples.dtype == sample_coding.format:
-				self.samples = samples
+			if samples.dtype == self.sample_coding.format:
+				return samples
 			else:
-				self.samples = samples.astype(sample_coding.format)
+				return samples.astype(self.sample_coding.format)
 		else:
 			if type(samples) in [bytes, bytearray, str]:
-				self.samples = numpy.frombuffer(samples, dtype=self.sample_coding.format)
+				return numpy.frombuffer(samples, dtype=self.sample_coding.format)
 			else:
-				self.samples = numpy.array(samples, dtype=self.sample_coding.format)
-
-		# Optional headers to add meta support to data slicing (get_input etc)
-		self.headers = headers
+				return numpy.array(samples, dtype=self.sample_coding.format)
+
+	@property
+	def samples(self):
+		if self.__samples_loader is not None:
+			self.__samples = self.__to_samples(self.__samples_loader())
+			self.__samples_loader = None
+		return self.__samples
+
+	@samples.setter
+	def samples(self, samples):
+		self.__samples_loader = None
+		self.__samples = samples
 
 	def __len__(self):
 		"""Returns the total number of samples in this trace"""
@@ -20,6 +20,9 @@ class TraceSet:
     resolved through the usage of storage engines (:py:obj:`Engine`).
     """
 
+    # Number of traces that are read at once when iterating over the trace set
+    ITERATOR_BATCH_SIZE = 256
+
     def __init__(self, path, mode='r', **options):
         # Defaults
         self.engine = None
@@ -50,14 +53,24 @@ class TraceSet:
     def __iter__(self):
         """ reset pointer """
         self.iterator_index = -1
+        self.iterator_batch_start = 0
+        self.iterator_batch = []
         return self
 
     def __next__(self):
         self.iterator_index = self.iterator_index + 1
 
         if self.iterator_index >= len(self):
+            self.iterator_batch = []
             raise StopIteration
-        return self[self.iterator_index]
+
+        # Read the traces in batches, which is a lot faster than reading them one by one
+        batch_index = self.iterator_index - self.iterator_batch_start
+        if not 0 <= batch_index < len(self.iterator_batch):
+            self.iterator_batch_start = self.iterator_index
+            self.iterator_batch = self[self.iterator_index:self.iterator_index + self.ITERATOR_BATCH_SIZE]
+            batch_index = 0
+        return self.iterator_batch[batch_index]
 
     def __enter__(self):
         """Called when entering a `with` block"""
@@ -88,6 +101,8 @@ class TraceSet:
         if self.engine.is_read_only():
             raise TypeError('Cannot modify trace set, it is (opened) read-only')
 
+        # Traces read ahead by an iteration over this trace set are outdated after a change
+        self.iterator_batch = []
         return self.engine.del_traces(index)
 
     def __setitem__(self, index, traces):
@@ -105,6 +120,7 @@ class TraceSet:
         if any(not isinstance(trace, Trace) for trace in traces):
             raise TypeError('All objects assigned to a trace set needs to be of type \'Trace\'')
 
+        self.iterator_batch = []
         return self.engine.set_traces(index, traces)
 
     def __getitem__(self, index):
@@ -120,6 +136,27 @@ class TraceSet:
             # Earlier logic should ensure traces contains one element!
             return traces[0]
 
+    def get_samples(self, index=slice(None)):
+        """Get the samples of zero or more traces as a single array, which is a lot faster than reading every
+        :py:obj:`Trace` when only the samples are needed. All selected traces must have the same sample coding and
+        number of samples.
+
+        On the TRS engine the array is a read-only, strided view on a copy of the trace records that were read, so it
+        does not change with later writes and remains valid after the trace set is closed. Use `numpy.array` to get a
+        writable, contiguous copy.
+
+        :param index: the slice of traces to get the samples of, or the index (negative indexes count from the end)
+            of a single trace. Defaults to all traces.
+        :type index: slice, int
+        :returns: an array with the samples of one trace per row for a slice, or the samples of the trace for an index
+        :rtype: numpy.ndarray
+        """
+        if self.engine.is_closed():
+            raise ValueError('I/O operation on closed trace set')
+
+        samples = self.engine.get_samples(index)
+        return samples if isinstance(index, slice) else samples[0]
+
     def is_closed(self):
         return self.engine.is_closed()
 
@@ -127,6 +164,14 @@ class TraceSet:
         if self.engine is not None:
             self.engine.close()
 
+    def flush(self):
+        """Write any pending changes of the trace set to its storage, so readers that open it see them while it
+        stays open for writing"""
+        if self.engine.is_closed():
+            raise ValueError('I/O operation on closed trace set')
+
+        self.engine.flush()
+
     def append(self, trace):
         self[len(self):len(self)] = trace
 
@@ -9,7 +9,7 @@ from typing import Any
 
 from numpy import ndarray, integer, uint8, double, single
 
-from trsfile.utils import encode_as_short, read_short
+from trsfile.utils import read_short
 
 UTF_8 = 'utf-8'
 BYTE_MIN = 0
@@ -19,6 +19,10 @@ SHORT_MAX = 2**15-1
 INT_MIN = -2**31
 INT_MAX = 2**31-1
 
+# The type tag, length and offset of a serialized TraceParameterDefinition
+_DEFINITION = struct.Struct('<Bhh')
+_DEFINITION_UNSIGNED = struct.Struct('<BHH')
+
 
 class TraceParameter(ABC):
     _expected_type_string = "None"
@@ -28,6 +32,11 @@ class TraceParameter(ABC):
     def deserialize(io_bytes: BytesIO, param_length: int):
         pass
 
+    @classmethod
+    def deserialize_from_buffer(cls, buffer, param_length: int):
+        """Deserialize a parameter from a bytes-like object that holds exactly the data of that parameter"""
+        return cls.deserialize(BytesIO(buffer), param_length)
+
     @abstractmethod
     def serialize(self) -> bytes:
         pass
@@ -83,8 +92,11 @@ class BooleanArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> BooleanArrayParameter:
-        raw_values = io_bytes.read(ParameterType.BOOL.byte_size * param_length)
-        param_value = [bool(x) for x in list(raw_values)]
+        return BooleanArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.BOOL.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> BooleanArrayParameter:
+        param_value = [bool(x) for x in buffer]
         return BooleanArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
@@ -112,7 +124,11 @@ class ByteArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int):
-        param_value = list(io_bytes.read(ParameterType.BYTE.byte_size * param_length))
+        return ByteArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.BYTE.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int):
+        param_value = list(buffer)
         return ByteArrayParameter(param_value, skip_validation=True)
 
     def __str__(self):
@@ -139,14 +155,15 @@ class DoubleArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> DoubleArrayParameter:
-        param_value = [struct.unpack('<d', io_bytes.read(ParameterType.DOUBLE.byte_size))[0] for i in range(param_length)]
+        return DoubleArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.DOUBLE.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> DoubleArrayParameter:
+        param_value = list(struct.unpack(f'<{param_length}d', buffer))
         return DoubleArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        for x in self.value:
-            out.extend(struct.pack('<d', x))
-        return bytes(out)
+        return struct.pack(f'<{len(self.value)}d', *self.value)
 
     @staticmethod
     def _has_expected_type(value: Any) -> bool:
@@ -162,14 +179,15 @@ class FloatArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> FloatArrayParameter:
-        param_value = [struct.unpack('<f', io_bytes.read(ParameterType.FLOAT.byte_size))[0] for i in range(param_length)]
+        return FloatArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.FLOAT.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> FloatArrayParameter:
+        param_value = list(struct.unpack(f'<{param_length}f', buffer))
         return FloatArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        for x in self.value:
-            out.extend(struct.pack('<f', x))
-        return bytes(out)
+        return struct.pack(f'<{len(self.value)}f', *self.value)
 
     @staticmethod
     def _has_expected_type(value: Any) -> bool:
@@ -185,14 +203,15 @@ class IntegerArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> IntegerArrayParameter:
-        param_value = [struct.unpack('<i', io_bytes.read(ParameterType.INT.byte_size))[0] for i in range(param_length)]
+        return IntegerArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.INT.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> IntegerArrayParameter:
+        param_value = list(struct.unpack(f'<{param_length}i', buffer))
         return IntegerArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        for x in self.value:
-            out.extend(struct.pack('<i', x))
-        return bytes(out)
+        return struct.pack(f'<{len(self.value)}i', *self.value)
 
     @staticmethod
     def _has_expected_type(value: Any) -> bool:
@@ -208,14 +227,15 @@ class LongArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> LongArrayParameter:
-        param_value = [struct.unpack('<q', io_bytes.read(ParameterType.LONG.byte_size))[0] for i in range(param_length)]
+        return LongArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.LONG.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> LongArrayParameter:
+        param_value = list(struct.unpack(f'<{param_length}q', buffer))
         return LongArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        for x in self.value:
-            out.extend(struct.pack('<q', x))
-        return bytes(out)
+        return struct.pack(f'<{len(self.value)}q', *self.value)
 
     @staticmethod
     def _has_expected_type(value: Any) -> bool:
@@ -231,14 +251,15 @@ class ShortArrayParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> ShortArrayParameter:
-        param_value = [struct.unpack('<h', io_bytes.read(ParameterType.SHORT.byte_size))[0] for i in range(param_length)]
+        return ShortArrayParameter.deserialize_from_buffer(io_bytes.read(ParameterType.SHORT.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> ShortArrayParameter:
+        param_value = list(struct.unpack(f'<{param_length}h', buffer))
         return ShortArrayParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
-        out = bytearray()
-        for x in self.value:
-            out.extend(struct.pack('<h', x))
-        return bytes(out)
+        return struct.pack(f'<{len(self.value)}h', *self.value)
 
     @staticmethod
     def _has_expected_type(value: Any) -> bool:
@@ -260,8 +281,11 @@ class StringParameter(TraceParameter):
 
     @staticmethod
     def deserialize(io_bytes: BytesIO, param_length: int) -> StringParameter:
-        bytes_read = io_bytes.read(ParameterType.STRING.byte_size * param_length)
-        param_value = bytes_read.decode(UTF_8)
+        return StringParameter.deserialize_from_buffer(io_bytes.read(ParameterType.STRING.byte_size * param_length), param_length)
+
+    @staticmethod
+    def deserialize_from_buffer(buffer, param_length: int) -> StringParameter:
+        param_value = str(buffer, UTF_8)
         return StringParameter(param_value, skip_validation=True)
 
     def serialize(self) -> bytes:
@@ -285,10 +309,10 @@ class ParameterType(Enum):
 
     @staticmethod
     def from_class(cls):
-        for val in ParameterType:
-            if cls is val.param_class:
-                return val
-        raise TypeError('{} is not valid ParameterType class'.format(cls.__name__))
+        try:
+            return _PARAMETER_TYPES_BY_CLASS[cls]
+        except KeyError:
+            raise TypeError('{} is not valid ParameterType class'.format(cls.__name__)) from None
 
     BYTE   = (0x01, 1, ByteArrayParameter)
     SHORT  = (0x02, 2, ShortArrayParameter)
@@ -300,12 +324,27 @@ class ParameterType(Enum):
     BOOL   = (0x31, 1, BooleanArrayParameter)
 
 
+_PARAMETER_TYPES_BY_CLASS = {param_type.param_class: param_type for param_type in ParameterType}
+
+
 class TraceParameterDefinition:
+    __slots__ = ('param_type', 'length', 'offset')
+
+    # The number of bytes of a serialized definition
+    SERIALIZED_SIZE = _DEFINITION.size
+
     def __init__(self, param_type: ParameterType, length: int, offset: int):
         self.param_type = param_type
         self.length = length
         self.offset = offset
 
+    def __setstate__(self, state):
+        # Definitions pickled before __slots__ was added have a plain dict as state, later ones a (None, slots) tuple
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __eq__(self, other):
         return self.param_type == other.param_type \
                and self.length == other.length \
@@ -317,14 +356,13 @@ class TraceParameterDefinition:
 
     @staticmethod
     def deserialize(io_bytes: BytesIO) -> TraceParameterDefinition:
-        param_type = ParameterType(io_bytes.read(1)[0])
-        length = read_short(io_bytes)
-        offset = read_short(io_bytes)
-        return TraceParameterDefinition(param_type, length, offset)
+        return TraceParameterDefinition.unpack_from(io_bytes.read(TraceParameterDefinition.SERIALIZED_SIZE))
 
-    def serialize(self) -> bytearray:
-        out = bytearray()
-        out.append(self.param_type.value)
-        out.extend(encode_as_short(self.length))
-        out.extend(encode_as_short(self.offset))
-        return out
+    @staticmethod
+    def unpack_from(buffer, position: int = 0) -> TraceParameterDefinition:
+        """Deserialize a definition from a bytes-like object, starting at the given position"""
+        tag, length, offset = _DEFINITION_UNSIGNED.unpack_from(buffer, position)
+        return TraceParameterDefinition(ParameterType(tag), length, offset)
+
+    def serialize(self) -> bytes:
+        return _DEFINITION.pack(self.param_type.value, self.length, self.offset)
@@ -5,9 +5,11 @@ from io import BytesIO
 LITTLE_ENDIAN_ORDER = 'little'
 UTF_8 = 'utf-8'
 
+_SHORT = struct.Struct('<h')
+
 
 def encode_as_short(value):
-    return struct.pack('<h', value)
+    return _SHORT.pack(value)
 
 
 def read_parameter_name(io_bytes: BytesIO):